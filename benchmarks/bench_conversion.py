@@ -0,0 +1,65 @@
+"""Memory benchmark of the OpenCV to screen path: `QT_QPA_PLATFORM=offscreen python benchmarks/bench_conversion.py`."""
+
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "imagedifftool"))
+
+import numpy as np
+from PyQt6.QtGui import QGuiApplication, QPixmap
+from image_tools import ImagePyramid
+from qt_image_tools import openCVToQImage
+from tiled_image_item import TiledImageItem
+
+WIDTH, HEIGHT = 8000, 6000
+
+
+def currentRSS() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * 4096
+
+
+def benchmarkConversion(name: str, openCVImage: np.ndarray):
+    tracemalloc.start()
+    image = openCVToQImage(openCVImage)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    shared = int(image.constBits()) == openCVImage.ctypes.data  # type: ignore
+    print(f"{name:<22} shared={str(shared):<5} numpy copies={peak / openCVImage.nbytes:.2f}")
+
+
+def benchmarkDisplayPath(openCVImage: np.ndarray):
+    """Upload every full-resolution tile, i.e. the worst case of a fully zoomed-in pan over the image."""
+    item = TiledImageItem()
+    item.MAX_CACHED_TILE_BYTES = 2**40
+    item.setPyramid(ImagePyramid(openCVImage))
+
+    before = currentRSS()
+    tracemalloc.start()
+    rows, columns = openCVImage.shape[0] // 512 + 1, openCVImage.shape[1] // 512 + 1
+    pixmaps: list[QPixmap] = [item.tile(0, column, row) for row in range(rows) for column in range(columns)]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pixmapBytes = sum(item.tileBytes(pixmap) for pixmap in pixmaps)
+
+    print(
+        f"display path           numpy copies={peak / openCVImage.nbytes:.2f} "
+        f"pixmap copies={pixmapBytes / (openCVImage.shape[0] * openCVImage.shape[1] * 4):.2f} "
+        f"RSS growth={(currentRSS() - before) / 2**20:.0f} MiB for {pixmapBytes / 2**20:.0f} MiB of pixmaps"
+    )
+
+
+if __name__ == "__main__":
+    app = QGuiApplication(sys.argv)
+    rng = np.random.default_rng(0)
+    bgr = rng.integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+    benchmarkConversion("BGR 8-bit", bgr)
+    benchmarkConversion("BGR 8-bit crop", bgr[100:-100, 100:-100])
+    benchmarkConversion("BGRA 8-bit", rng.integers(0, 256, (HEIGHT, WIDTH, 4), dtype=np.uint8))
+    benchmarkConversion("grayscale 8-bit", rng.integers(0, 256, (HEIGHT, WIDTH), dtype=np.uint8))
+    benchmarkConversion("grayscale 16-bit", rng.integers(0, 2**16, (HEIGHT, WIDTH), dtype=np.uint16))
+    benchmarkConversion("BGR 16-bit", rng.integers(0, 2**16, (HEIGHT, WIDTH, 3), dtype=np.uint16))
+    benchmarkDisplayPath(bgr)
@@ -0,0 +1,74 @@
+"""Time and memory benchmark of the region metrics on a 4K region: `python benchmarks/bench_metrics.py`."""
+
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "imagedifftool"))
+
+import cv2
+import numpy as np
+from metrics import METRICS, SummedAreaTable, differenceTable, ssim
+
+WIDTH, HEIGHT = 3840, 2160
+REPEATS = 5
+OVERLAPPING_REGIONS = 500
+
+
+def benchmarkMetric(name: str, metric, first: np.ndarray, second: np.ndarray):
+    metric(first, second)  # Warm up OpenCV's thread pool and kernels.
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        score = metric(first, second)
+    seconds = (time.perf_counter() - start) / REPEATS
+
+    tracemalloc.start()
+    metric(first, second)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    floatCopy = first.size * np.dtype(np.float32).itemsize
+    print(f"{name:<14} {seconds * 1000:8.1f} ms  score={score:9.4f}  float32 copies={peak / floatCopy:.1f}")
+
+
+def benchmarkOverlappingRegions(reference: np.ndarray, sample: np.ndarray):
+    rng = np.random.default_rng(1)
+    x = rng.integers(0, WIDTH // 2, OVERLAPPING_REGIONS)
+    y = rng.integers(0, HEIGHT // 2, OVERLAPPING_REGIONS)
+    rectangles = np.stack([x, y, rng.integers(1, WIDTH // 2, x.size), rng.integers(1, HEIGHT // 2, y.size)], axis=1)
+
+    start = time.perf_counter()
+    for x, y, width, height in rectangles:
+        window = (slice(y, y + height), slice(x, x + width))
+        cv2.meanStdDev(reference[window])
+        cv2.mean(cv2.absdiff(reference[window], sample[window]))
+    slicing = time.perf_counter() - start
+
+    start = time.perf_counter()
+    table = SummedAreaTable(reference)
+    table.mean(rectangles), table.variance(rectangles)
+    differenceTable(reference, sample, squared=False).mean(rectangles)
+    summedArea = time.perf_counter() - start
+
+    print(
+        f"{OVERLAPPING_REGIONS} overlapping regions: slicing {slicing * 1000:.0f} ms, "
+        f"summed-area tables {summedArea * 1000:.0f} ms (mean, variance and mean absolute difference)"
+    )
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    reference = cv2.GaussianBlur(rng.integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8), (0, 0), 3)
+    sample = cv2.add(reference, rng.integers(0, 8, reference.shape, dtype=np.uint8))
+
+    for label, first, second in [
+        ("BGR", reference, sample),
+        ("gray", cv2.cvtColor(reference, cv2.COLOR_BGR2GRAY), cv2.cvtColor(sample, cv2.COLOR_BGR2GRAY)),
+    ]:
+        print(f"{label} {WIDTH}x{HEIGHT}")
+        for name, metric in METRICS.items():
+            benchmarkMetric(name, metric, first, second)
+        benchmarkMetric("ssim (box)", lambda a, b: ssim(a, b, gaussian=False), first, second)
+
+    benchmarkOverlappingRegions(reference, sample)
@@ -0,0 +1,49 @@
+"""Time from launching the GUI to its first window: `python benchmarks/bench_startup.py [runs]`."""
+
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PACKAGE_DIRECTORY = Path(__file__).resolve().parent.parent / "imagedifftool"
+
+CHILD = """
+import sys
+from main_window import MainWindow, createApplication
+from PyQt6.QtCore import QTimer
+
+app = createApplication()
+window = MainWindow()
+window.show()
+QTimer.singleShot(0, lambda: (print("window shown", "cv2" in sys.modules, flush=True), app.quit()))
+app.exec()
+"""
+
+
+def timeToFirstWindow() -> tuple[float, bool]:
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", CHILD],
+        cwd=PACKAGE_DIRECTORY,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    assert process.stdout is not None
+    for line in process.stdout:
+        if line.startswith("window shown"):
+            elapsed = time.perf_counter() - start
+            process.wait()
+            return elapsed, line.split()[-1] == "True"
+    raise RuntimeError("The GUI exited without showing a window")
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    timings = []
+    for run in range(runs):
+        elapsed, cv2Loaded = timeToFirstWindow()
+        timings.append(elapsed)
+        print(f"run {run}: {elapsed * 1000:.0f} ms to first window, cv2 imported: {cv2Loaded}")
+    print(f"min {min(timings) * 1000:.0f} ms, median {statistics.median(timings) * 1000:.0f} ms")
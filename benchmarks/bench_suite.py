@@ -0,0 +1,179 @@
+"""Benchmark suite for image_tools and the path from a file to the screen; --compare an earlier result."""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+PACKAGE_DIRECTORY = Path(__file__).resolve().parent.parent / "imagedifftool"
+sys.path.insert(0, str(PACKAGE_DIRECTORY))
+
+import cv2
+import numpy as np
+from image_tools import getOpenCVImage, rotateClockwise, rotateCounterClockwise, toGrayScale
+from image_view import ImageView
+from PyQt6.QtCore import PYQT_VERSION_STR, QEventLoop, QTimer
+from PyQt6.QtGui import QPixmap
+from PyQt6.QtWidgets import QApplication
+from qt_image_tools import openCVToQImage
+
+VARIANTS = {  # Name: (channels, dtype).
+    "gray8": (1, np.uint8),
+    "bgr8": (3, np.uint8),
+    "gray16": (1, np.uint16),
+    "bgr16": (3, np.uint16),
+}
+DEFAULT_SIZES = (1, 10, 100)
+DEFAULT_REPEATS = 3
+VIEW_SIZE = (1280, 800)
+LOAD_TIMEOUT = 120_000  # Milliseconds to wait for ImageView to show an image.
+
+
+def syntheticImage(megapixels: float, channels: int, dtype: type) -> np.ndarray:
+    """A 4:3 image of smooth gradients and fine stripes, so it compresses like a photo rather than like noise."""
+    height = int(round((megapixels * 1e6 * 3 / 4) ** 0.5))
+    width = int(round(megapixels * 1e6 / height))
+    maxValue = np.iinfo(dtype).max
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, np.newaxis]
+    planes = [
+        (x * y + 0.1 * np.sin(x * (200 + 50 * channel)) * np.cos(y * 150)) * (0.8 * maxValue) + 0.1 * maxValue
+        for channel in range(channels)
+    ]
+    image = np.dstack(planes) if channels > 1 else planes[0]
+    return image.astype(dtype)
+
+
+def timeIt(function: Callable[[], object], repeats: int) -> dict:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": statistics.median(timings), "repeats": repeats}
+
+
+def showInView(view: ImageView, filePath: str):
+    """Load an image into the view and wait until it is shown, as a user would."""
+    loop = QEventLoop()
+    view.imageChangedSignal.connect(loop.quit)
+    QTimer.singleShot(LOAD_TIMEOUT, loop.quit)
+    view.setImage(filePath)
+    loop.exec()
+    view.imageChangedSignal.disconnect(loop.quit)
+    view.viewport().grab()  # Paint the first frame.
+
+
+def zoomFitAndPaint(view: ImageView):
+    view.zoomIn()  # zoomFit from a zoomed in view, so the tiles of another pyramid level are drawn.
+    view.zoomFit()
+    view.viewport().grab()
+
+
+def benchmarkImage(image: np.ndarray, filePath: str, view: ImageView, repeats: int) -> dict[str, dict]:
+    results = {}
+    cv2.imwrite(filePath, image, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    results["getOpenCVImage"] = timeIt(lambda: getOpenCVImage(filePath), repeats)
+    if image.ndim == 3:
+        results["toGrayScale"] = timeIt(lambda: toGrayScale(image), repeats)
+    results["rotateClockwise"] = timeIt(lambda: rotateClockwise(image), repeats)
+    results["rotateCounterClockwise"] = timeIt(lambda: rotateCounterClockwise(image), repeats)
+    results["openCVToQImage"] = timeIt(lambda: openCVToQImage(image), repeats)
+    qImage = openCVToQImage(image)
+    results["QPixmap.fromImage"] = timeIt(lambda: QPixmap.fromImage(qImage), repeats)
+
+    results["ImageView.setImage"] = timeIt(lambda: showInView(view, filePath), repeats)
+    results["ImageView.zoomFit"] = timeIt(lambda: zoomFitAndPaint(view), repeats)
+    Path(filePath).unlink()
+    return results
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=PACKAGE_DIRECTORY, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "created": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "pyqt": PYQT_VERSION_STR,
+    }
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float):
+    """Print the ratio of each median to the baseline's, marking slowdowns beyond `threshold`."""
+    before = {(entry["benchmark"], entry["variant"], entry["megapixels"]): entry for entry in baseline}
+    for entry in results:
+        previous = before.get((entry["benchmark"], entry["variant"], entry["megapixels"]))
+        if previous is None:
+            continue
+        ratio = entry["median"] / previous["median"] if previous["median"] else float("inf")
+        marker = "  REGRESSION" if ratio > threshold else ""
+        print(
+            f"{entry['benchmark']:<24} {entry['variant']:<7} {entry['megapixels']:>5g} MP "
+            f"{previous['median'] * 1000:9.1f} -> {entry['median'] * 1000:9.1f} ms  x{ratio:.2f}{marker}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--sizes",
+        type=float,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="image sizes in megapixels; 100 MP of 16-bit BGR alone takes 600 MB",
+    )
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=list(VARIANTS))
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--output", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--compare", type=Path, help="JSON file of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.1, help="slowdown ratio reported as a regression")
+    arguments = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    view = ImageView()
+    view.resize(*VIEW_SIZE)
+    view.show()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for megapixels in arguments.sizes:
+            for variant in arguments.variants:
+                channels, dtype = VARIANTS[variant]
+                image = syntheticImage(megapixels, channels, dtype)
+                filePath = str(Path(directory) / f"{variant}.png")
+                for benchmark, timing in benchmarkImage(image, filePath, view, arguments.repeats).items():
+                    results.append({"benchmark": benchmark, "variant": variant, "megapixels": megapixels, **timing})
+                    print(
+                        f"{benchmark:<24} {variant:<7} {megapixels:>5g} MP "
+                        f"min {timing['min'] * 1000:9.1f} ms  median {timing['median'] * 1000:9.1f} ms",
+                        flush=True,
+                    )
+                del image
+    view.close()
+    app.processEvents()
+
+    if arguments.output is not None:
+        arguments.output.write_text(json.dumps({"metadata": metadata(), "results": results}, indent=2))
+    if arguments.compare is not None:
+        print(f"\nCompared to {arguments.compare}:")
+        compare(results, json.loads(arguments.compare.read_text())["results"], arguments.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""Alignment of samples to the reference before their regions are compared."""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Iterable
+
+import cv2
+import numpy as np
+from region import Region, boundingBox
+
+MOTIONS = ("translation", "affine")
+COARSE_SIZE = 512
+REFINE_MARGIN = 32
+_ECC_CRITERIA = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 50, 1e-4)
+
+
+def _toGrayFloat(openCVImage: cv2.Mat) -> np.ndarray:
+    if openCVImage.ndim == 3:
+        openCVImage = cv2.cvtColor(openCVImage, cv2.COLOR_BGR2GRAY)
+    return openCVImage.astype(np.float32)
+
+
+def _toHomogeneous(matrix: np.ndarray) -> np.ndarray:
+    return np.vstack([matrix, [0, 0, 1]]).astype(np.float64)
+
+
+def _translation(x: float, y: float) -> np.ndarray:
+    return np.array([[1, 0, x], [0, 1, y], [0, 0, 1]], dtype=np.float64)
+
+
+def warpRegion(openCVImage: cv2.Mat, transform: np.ndarray, region: Region) -> cv2.Mat:
+    """Return the sample pixels that land on `region` of the reference once the sample is aligned."""
+    shifted = (_toHomogeneous(transform) @ _translation(region.x, region.y))[:2]
+    return cv2.warpAffine(
+        openCVImage,
+        shifted,
+        (region.width, region.height),
+        flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+        borderMode=cv2.BORDER_REPLICATE,
+    )
+
+
+class Aligner:
+    """Estimates and caches the transforms aligning samples to one reference.
+
+    Everything derived from the reference is prepared once. Transforms are cached
+    by sample path, modification time and size in an optional JSON file, which is
+    discarded when the reference, the motion model or the regions change."""
+
+    def __init__(
+        self,
+        reference: cv2.Mat,
+        regions: Iterable[Region],
+        motion: str = "translation",
+        cachePath: str | Path | None = None,
+    ):
+        if motion not in MOTIONS:
+            raise ValueError(f"Unknown motion model {motion!r}.")
+        self.motion = motion
+
+        referenceGray = _toGrayFloat(reference)
+        height, width = referenceGray.shape
+        coarseScale = min(COARSE_SIZE / max(width, height), 1.0)
+        self.coarseSize = (max(round(width * coarseScale), 1), max(round(height * coarseScale), 1))
+        self.coarseToFull = np.diag([width / self.coarseSize[0], height / self.coarseSize[1], 1.0])
+        self.coarseReference = cv2.resize(referenceGray, self.coarseSize, interpolation=cv2.INTER_AREA)
+        self.coarseWindow = cv2.createHanningWindow(self.coarseSize, cv2.CV_32F)
+
+        self.refineBox = boundingBox(regions).expanded(REFINE_MARGIN).clipped(width, height)
+        box = self.refineBox
+        self.refineReference = np.ascontiguousarray(
+            referenceGray[box.y : box.y + box.height, box.x : box.x + box.width]
+        )
+        self.refineWindow = cv2.createHanningWindow((box.width, box.height), cv2.CV_32F)
+
+        self.cachePath = Path(cachePath) if cachePath is not None else None
+        fingerprint = hashlib.blake2b(f"{motion} {tuple(box)} {reference.shape}".encode(), digest_size=16)
+        fingerprint.update(np.ascontiguousarray(reference).data)
+        self.fingerprint = fingerprint.hexdigest()
+        self.transforms: dict[str, dict] = {}
+        self.lock = threading.Lock()
+        if self.cachePath is not None and self.cachePath.exists():
+            cached = json.loads(self.cachePath.read_text())
+            if cached.get("fingerprint") == self.fingerprint:
+                self.transforms = cached["transforms"]
+
+    def cachedTransform(self, samplePath: str) -> np.ndarray | None:
+        entry = self.transforms.get(os.path.abspath(samplePath))
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(samplePath)
+        except OSError:
+            return None
+        if entry["mtime"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            return None
+        return np.array(entry["matrix"], dtype=np.float64)
+
+    def rememberTransform(self, samplePath: str, transform: np.ndarray):
+        try:
+            stat = os.stat(samplePath)
+        except OSError:
+            return
+        with self.lock:
+            self.transforms[os.path.abspath(samplePath)] = {
+                "mtime": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "matrix": np.asarray(transform).tolist(),
+            }
+
+    def saveCache(self):
+        if self.cachePath is None:
+            return
+        with self.lock:
+            temporaryPath = self.cachePath.with_name(f"{self.cachePath.name}.tmp")
+            temporaryPath.write_text(json.dumps({"fingerprint": self.fingerprint, "transforms": self.transforms}))
+            os.replace(temporaryPath, self.cachePath)
+
+    def estimate(self, sample: cv2.Mat) -> np.ndarray:
+        """Return the 2x3 transform mapping reference coordinates to coordinates in `sample`."""
+        sampleGray = _toGrayFloat(sample)
+        coarse = self.estimateCoarse(cv2.resize(sampleGray, self.coarseSize, interpolation=cv2.INTER_AREA))
+        transform = self.coarseToFull @ coarse @ np.linalg.inv(self.coarseToFull)
+        return self.refine(sampleGray, transform)[:2]
+
+    def estimateCoarse(self, coarseSample: np.ndarray) -> np.ndarray:
+        (dx, dy), _ = cv2.phaseCorrelate(self.coarseReference, coarseSample, self.coarseWindow)
+        transform = _translation(dx, dy)
+        if self.motion == "affine":
+            transform = self.refineAffine(self.coarseReference, coarseSample, transform)
+        return transform
+
+    def refine(self, sampleGray: np.ndarray, transform: np.ndarray) -> np.ndarray:
+        """Re-estimate the residual motion on the full resolution area around the regions."""
+        box = self.refineBox
+        warped = warpRegion(sampleGray, transform[:2], box)
+        if self.motion == "translation":
+            (dx, dy), _ = cv2.phaseCorrelate(self.refineReference, warped, self.refineWindow)
+            residual = _translation(dx, dy)
+        else:
+            residual = self.refineAffine(self.refineReference, warped, np.eye(3))
+        # The residual is in the coordinates of the refined box; move it back to image coordinates.
+        return transform @ _translation(box.x, box.y) @ residual @ _translation(-box.x, -box.y)
+
+    @staticmethod
+    def refineAffine(template: np.ndarray, image: np.ndarray, transform: np.ndarray) -> np.ndarray:
+        """Refine a transform with ECC, keeping the initial one if ECC does not converge."""
+        warp = transform[:2].astype(np.float32)
+        try:
+            _, warp = cv2.findTransformECC(template, image, warp, cv2.MOTION_AFFINE, _ECC_CRITERIA, None, 5)
+        except cv2.error:
+            return transform
+        return _toHomogeneous(warp)
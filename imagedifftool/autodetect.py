@@ -0,0 +1,116 @@
+"""Coarse to fine detection of the areas where a sample differs from the reference."""
+
+import cv2
+import numpy as np
+from image_tools import ImagePyramid
+from region import Region, boundingBox
+
+THRESHOLD = 32  # Smallest difference of an 8-bit channel value counted as a change at full resolution.
+MINIMUM_SIZE = 8  # Side in pixels of the smallest square change that must be found.
+NOISE_FLOOR = 4  # Coarse levels whose threshold would fall below this are not searched; noise dominates there.
+MARGIN = 2  # Pixels searched around a candidate at the next finer level, for changes straddling its border.
+MERGE_DISTANCE = 8  # Regions closer than this are merged into one.
+
+
+def _valueScale(dtype: np.dtype) -> float:
+    """Return the factor from 8-bit values to values of the given type."""
+    if dtype.kind in "ui":
+        return np.iinfo(dtype).max / 255
+    return 1 / 255  # Floating point images range from 0 to 1.
+
+
+def _difference(reference: cv2.Mat, sample: cv2.Mat) -> np.ndarray:
+    difference = cv2.absdiff(reference, sample)
+    if difference.ndim == 3:
+        difference = difference.max(axis=2)
+    return difference
+
+
+def _components(changed: np.ndarray) -> list[Region]:
+    count, _, stats, _ = cv2.connectedComponentsWithStats(changed.view(np.uint8), connectivity=8)
+    return [Region(int(x), int(y), int(width), int(height)) for x, y, width, height, _ in stats[1:count]]
+
+
+def _overlaps(region: Region, other: Region) -> bool:
+    return (
+        region.x < other.x + other.width
+        and other.x < region.x + region.width
+        and region.y < other.y + other.height
+        and other.y < region.y + region.height
+    )
+
+
+def mergeRegions(regions: list[Region], distance: int = 0) -> list[Region]:
+    """Merge regions that overlap or lie within `distance` pixels of each other, until none do."""
+    merged: list[Region] = []
+    for region in sorted(regions):
+        while overlapping := [other for other in merged if _overlaps(region.expanded(distance), other)]:
+            for other in overlapping:
+                merged.remove(other)
+            region = boundingBox([region, *overlapping])
+        merged.append(region)
+    return merged
+
+
+def levelThreshold(level: int, threshold: float, minimumSize: int) -> float:
+    """Return the threshold at a pyramid level that still catches a change of `minimumSize` pixels at `threshold`.
+
+    At level n a pixel averages 4**n full resolution pixels, so a smaller change
+    is diluted by the rest of them, and a change straddling pixel borders may be
+    split across up to four pixels."""
+    if level == 0:
+        return threshold
+    coverage = min(1.0, (minimumSize / 2**level) ** 2)
+    return threshold * coverage / 4
+
+
+def detectChangedRegions(
+    reference: ImagePyramid,
+    sample: ImagePyramid,
+    threshold: int = THRESHOLD,
+    minimumSize: int = MINIMUM_SIZE,
+) -> list[Region]:
+    """Return the bounding boxes of the areas where the sample differs from the reference, in reading order.
+
+    Both pyramids must be of images of the same size and type; the sample is
+    assumed to be aligned to the reference."""
+    if reference.levels[0].shape != sample.levels[0].shape or reference.levels[0].dtype != sample.levels[0].dtype:
+        raise ValueError("The sample size does not match the reference size.")
+    valueScale = _valueScale(reference.levels[0].dtype)
+    level = len(reference.levels) - 1
+    while level > 0 and levelThreshold(level, threshold, minimumSize) < NOISE_FLOOR:
+        level -= 1
+
+    height, width = reference.levels[level].shape[:2]
+    candidates = [Region(0, 0, width, height)]
+    while True:
+        referenceLevel, sampleLevel = reference.levels[level], sample.levels[level]
+        changedThreshold = levelThreshold(level, threshold, minimumSize) * valueScale
+        found: list[Region] = []
+        for candidate in candidates:
+            area = np.s_[candidate.y : candidate.y + candidate.height, candidate.x : candidate.x + candidate.width]
+            changed = _difference(referenceLevel[area], sampleLevel[area]) > changedThreshold
+            found.extend(region.translated(candidate.x, candidate.y) for region in _components(changed))
+        if level == 0:
+            break
+
+        level -= 1
+        (coarseX, coarseY), (fineX, fineY) = reference.levelScale(level + 1), reference.levelScale(level)
+        scaleX, scaleY = coarseX / fineX, coarseY / fineY
+        height, width = reference.levels[level].shape[:2]
+        candidates = mergeRegions(
+            [
+                Region(
+                    int(region.x * scaleX),
+                    int(region.y * scaleY),
+                    int(np.ceil(region.width * scaleX)) + 1,
+                    int(np.ceil(region.height * scaleY)) + 1,
+                )
+                .expanded(MARGIN)
+                .clipped(width, height)
+                for region in found
+            ]
+        )
+
+    regions = mergeRegions(found, MERGE_DISTANCE)
+    return sorted(regions, key=lambda region: (region.y, region.x))
@@ -0,0 +1,267 @@
+"""Headless command line interface. Never imports Qt."""
+
+import argparse
+import csv
+import json
+import math
+import sys
+from pathlib import Path
+from typing import Iterator, TextIO
+
+from alignment import MOTIONS, Aligner
+from autodetect import MINIMUM_SIZE, THRESHOLD, detectChangedRegions
+from engine import RegionIndex, SampleResult
+from image_store import ImageStore
+from image_tools import ImagePyramid, getOpenCVImage, setImageStore
+from metrics import METRICS
+from phash import hashFile
+from pipeline import (
+    DeduplicatedComparison,
+    IncrementalComparison,
+    Pipeline,
+    SampleItem,
+    comparisonPipeline,
+    discover,
+    findSamples,
+)
+from profiling import timed
+from region import Region
+from results_db import ResultDatabase
+from watch import DirectoryPoller
+
+Comparison = Pipeline | IncrementalComparison | DeduplicatedComparison
+
+
+def loadRegions(filePath: str) -> list[Region]:
+    regions = []
+    for item in json.loads(Path(filePath).read_text()):
+        if isinstance(item, dict):
+            regions.append(Region(int(item["x"]), int(item["y"]), int(item["width"]), int(item["height"])))
+        else:
+            regions.append(Region(*map(int, item)))
+    return regions
+
+
+class ResultWriter:
+    def __init__(self, output: TextIO, outputFormat: str, regionCount: int):
+        self.output = output
+        self.regionCount = regionCount
+        self.csvWriter = None
+        if outputFormat == "csv":
+            self.csvWriter = csv.writer(output)
+            self.csvWriter.writerow(["sample", *(f"region{i}" for i in range(regionCount)), "error"])
+
+    def write(self, result: SampleResult):
+        scores = None
+        if result.scores is not None:
+            # JSON has no infinity, e.g. for the PSNR of identical regions; write those as null.
+            scores = [float(score) if math.isfinite(score) else None for score in result.scores]
+        if self.csvWriter is not None:
+            cells = ["" if score is None else score for score in scores] if scores is not None else []
+            cells += [""] * (self.regionCount - len(cells))
+            self.csvWriter.writerow([result.filePath, *cells, result.error or ""])
+        else:
+            record = {"sample": result.filePath, "scores": scores, "error": result.error}
+            self.output.write(json.dumps(record, allow_nan=False) + "\n")
+        self.output.flush()  # Consumers downstream of a pipe should see each result as soon as it exists.
+
+
+def createComparison(arguments: argparse.Namespace) -> tuple[Comparison, int] | None:
+    """Set up the comparison the arguments describe; returns it with the number of regions, or None on error."""
+    if arguments.store:
+        setImageStore(ImageStore(arguments.store))
+
+    reference = getOpenCVImage(arguments.reference)
+    if reference is None:
+        print(f"Could not load reference image {arguments.reference}", file=sys.stderr)
+        return None
+    try:
+        regions = loadRegions(arguments.regions)
+        RegionIndex(reference.shape, regions)  # Fail early on regions outside the reference.
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        print(f"Could not load regions from {arguments.regions}: {error}", file=sys.stderr)
+        return None
+    aligner = None
+    if arguments.align:
+        aligner = Aligner(reference, regions, arguments.align, arguments.transform_cache)
+    workers = arguments.workers or None
+
+    if arguments.database:
+        database = ResultDatabase(arguments.database)
+        comparison = IncrementalComparison(
+            reference,
+            regions,
+            database,
+            arguments.metric,
+            aligner,
+            workers,
+            arguments.max_in_flight,
+            arguments.queue_depth,
+        )
+    else:
+        comparison = comparisonPipeline(
+            reference,
+            regions,
+            arguments.metric,
+            aligner,
+            workers,
+            arguments.max_in_flight,
+            queueDepth=arguments.queue_depth,
+        )
+    if arguments.skip_identical or arguments.group_duplicates is not None:
+        referenceHashes = hashFile(arguments.reference) if arguments.skip_identical else None
+        comparison = DeduplicatedComparison(
+            comparison, reference, regions, arguments.metric, referenceHashes, arguments.group_duplicates or 0
+        )
+    return comparison, len(regions)
+
+
+@timed("compare")
+def writeResults(comparison: Comparison, items: Iterator[SampleItem], writer: ResultWriter):
+    results = comparison.run(items)
+    try:
+        for result in results:
+            writer.write(result)
+    finally:
+        results.close()
+
+
+def compare(arguments: argparse.Namespace) -> int:
+    created = createComparison(arguments)
+    if created is None:
+        return 2
+    comparison, regionCount = created
+
+    output = open(arguments.output, "w", newline="") if arguments.output else sys.stdout
+    try:
+        writeResults(comparison, discover(arguments.samples), ResultWriter(output, arguments.format, regionCount))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(comparison.stats(), f"{comparison.failed} failed", file=sys.stderr)
+    return 1 if comparison.failed else 0
+
+
+def watch(arguments: argparse.Namespace) -> int:
+    created = createComparison(arguments)
+    if created is None:
+        return 2
+    comparison, regionCount = created
+
+    output = open(arguments.output, "a", newline="") if arguments.output else sys.stdout
+    writer = ResultWriter(output, arguments.format, regionCount)
+    try:
+        for changed in DirectoryPoller(arguments.directory).watch(arguments.interval):
+            writeResults(comparison, (SampleItem(samplePath) for samplePath in changed), writer)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(comparison.stats(), f"{comparison.failed} failed", file=sys.stderr)
+    return 0
+
+
+def ingest(arguments: argparse.Namespace) -> int:
+    imageStore = ImageStore(arguments.store)
+
+    def progress(filePath: str, succeeded: bool):
+        if not succeeded:
+            print(f"Could not load image {filePath}", file=sys.stderr)
+
+    ingested = imageStore.ingest(findSamples(arguments.samples), progress)
+    print(f"Ingested {ingested} image(s), {len(imageStore)} in store", file=sys.stderr)
+    return 0
+
+
+def detect(arguments: argparse.Namespace) -> int:
+    images = []
+    for filePath in (arguments.reference, arguments.sample):
+        image = getOpenCVImage(filePath)
+        if image is None:
+            print(f"Could not load image {filePath}", file=sys.stderr)
+            return 2
+        images.append(ImagePyramid(image))
+    try:
+        regions = detectChangedRegions(*images, arguments.threshold, arguments.minimum_size)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+
+    output = json.dumps([list(region) for region in regions])
+    if arguments.output:
+        Path(arguments.output).write_text(output + "\n")
+    else:
+        print(output)
+    print(f"Detected {len(regions)} changed region(s)", file=sys.stderr)
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="imagedifftool", description="Compare regions of images against a reference.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def addComparisonArguments(commandParser: argparse.ArgumentParser):
+        commandParser.add_argument("--reference", required=True, help="reference image")
+        commandParser.add_argument("--regions", required=True, help="JSON file with the regions to compare")
+        commandParser.add_argument("--metric", choices=list(METRICS), default="mad", help="score to compute per region")
+        commandParser.add_argument("--align", choices=MOTIONS, help="align samples to the reference before comparing")
+        commandParser.add_argument("--transform-cache", help="JSON file caching alignment transforms between runs")
+        commandParser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+        commandParser.add_argument("--output", help="write results to this file instead of stdout")
+        commandParser.add_argument("--workers", type=int, default=0, help="worker processes, 0 for one per CPU")
+        commandParser.add_argument("--max-in-flight", type=int, help="samples submitted to workers at once")
+        commandParser.add_argument(
+            "--queue-depth", type=int, default=4, help="samples buffered between pipeline stages"
+        )
+        commandParser.add_argument("--store", help="image store directory to read pre-decoded samples from")
+        commandParser.add_argument(
+            "--skip-identical",
+            action="store_true",
+            help="score samples whose perceptual hashes equal the reference's as the reference, without comparing",
+        )
+        commandParser.add_argument(
+            "--group-duplicates",
+            type=int,
+            metavar="BITS",
+            help="compare samples within this perceptual hash distance of each other once and share the scores",
+        )
+
+    compareParser = commands.add_parser("compare", help="compare samples against a reference image")
+    addComparisonArguments(compareParser)
+    compareParser.add_argument("--database", help="SQLite result database to reuse and store scores in")
+    compareParser.add_argument("samples", nargs="+", help="sample images or directories of them")
+    compareParser.set_defaults(run=compare)
+
+    watchParser = commands.add_parser("watch", help="compare new and modified samples as they appear in a directory")
+    addComparisonArguments(watchParser)
+    watchParser.add_argument("--database", required=True, help="SQLite result database to reuse and store scores in")
+    watchParser.add_argument("--interval", type=float, default=1.0, help="seconds between directory scans")
+    watchParser.add_argument("directory", help="directory to watch")
+    watchParser.set_defaults(run=watch)
+
+    ingestParser = commands.add_parser("ingest", help="pre-decode samples into an image store")
+    ingestParser.add_argument("--store", required=True, help="image store directory")
+    ingestParser.add_argument("samples", nargs="+", help="sample images or directories of them")
+    ingestParser.set_defaults(run=ingest)
+
+    detectParser = commands.add_parser("detect", help="find the regions where a sample differs from the reference")
+    detectParser.add_argument("--reference", required=True, help="reference image")
+    detectParser.add_argument(
+        "--threshold", type=int, default=THRESHOLD, help="smallest 8-bit value difference counted"
+    )
+    detectParser.add_argument(
+        "--minimum-size", type=int, default=MINIMUM_SIZE, help="side of the smallest change to find"
+    )
+    detectParser.add_argument("--output", help="write the regions to this JSON file instead of stdout")
+    detectParser.add_argument("sample", help="sample image, aligned to the reference")
+    detectParser.set_defaults(run=detect)
+
+    arguments = parser.parse_args(argv)
+    return arguments.run(arguments)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
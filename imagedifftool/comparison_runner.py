@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from orientation import Orientation
+from profiling import timed
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+    import cv2
+    from region import Region
+
+
+class ComparisonRunnerSignals(QObject):
+    sessionSignal = pyqtSignal(int, int)
+    resultSignal = pyqtSignal(int, object)
+    finishedSignal = pyqtSignal(int, object)
+    failedSignal = pyqtSignal(int, str)
+
+
+class ComparisonRunner(QRunnable):
+    """Runs the comparison pipeline off the GUI thread, emitting each result as it arrives.
+
+    This is the same result stream the command line writes out; `generation` is
+    handed back with every result so superseded runs can be told apart. With a
+    result database, only scores it does not hold yet are computed, and every
+    result is recorded in session `sessionId`, or in a new session announced
+    through `sessionSignal` if it is None."""
+
+    def __init__(
+        self,
+        generation: int,
+        reference: cv2.Mat,
+        regions: list[Region],
+        samplePaths: list[str],
+        databasePath: Path | None = None,
+        referencePath: str = "",
+        sessionId: int | None = None,
+        orientation: Orientation = Orientation(),
+        executor: ProcessPoolExecutor | None = None,
+    ):
+        super().__init__()
+
+        self.generation = generation
+        self.reference = reference
+        self.regions = list(regions)
+        self.samplePaths = list(samplePaths)
+        self.databasePath = databasePath
+        self.referencePath = referencePath
+        self.sessionId = sessionId
+        self.orientation = orientation
+        self.executor = executor
+        self.cancelled = False
+        self.signals = ComparisonRunnerSignals()
+
+    def cancel(self):
+        self.cancelled = True
+
+    @timed("compare")
+    def run(self):
+        from pipeline import IncrementalComparison, comparisonPipeline, discover
+        from results_db import ResultDatabase
+
+        database = None
+        try:
+            if self.databasePath is not None:
+                database = ResultDatabase(self.databasePath)  # SQLite connections belong to the thread opening them.
+                comparison = IncrementalComparison(
+                    self.reference, self.regions, database, workers=None, executor=self.executor
+                )
+                if self.sessionId is None:
+                    self.sessionId = database.createSession(
+                        self.referencePath, self.regions, self.samplePaths, orientation=self.orientation
+                    )
+                    self.signals.sessionSignal.emit(self.generation, self.sessionId)
+                else:
+                    database.addSessionSamples(self.sessionId, self.samplePaths)
+            else:
+                comparison = comparisonPipeline(self.reference, self.regions, workers=None, executor=self.executor)
+            results = comparison.run(discover(self.samplePaths))
+            try:
+                for result in results:
+                    if self.cancelled:
+                        return
+                    if database is not None:
+                        database.recordResult(self.sessionId, result)  # Committed along with the scores.
+                    self.signals.resultSignal.emit(self.generation, result)
+            finally:
+                results.close()
+        except Exception as exception:  # Nothing above the thread pool would report it.
+            self.signals.failedSignal.emit(self.generation, str(exception))
+            return
+        finally:
+            if database is not None:
+                database.close()
+        self.signals.finishedSignal.emit(self.generation, comparison.stats())
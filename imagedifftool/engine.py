@@ -0,0 +1,257 @@
+"""Headless comparison engine. Never imports Qt."""
+
+import time
+from typing import Iterable, Iterator, NamedTuple
+
+import cv2
+import numpy as np
+from alignment import Aligner, warpRegion
+from image_tools import getOpenCVImage, getOpenCVImageRegion
+from metrics import METRICS, differenceTable
+from region import Region, boundingBox
+
+
+class SampleResult(NamedTuple):
+    filePath: str
+    scores: np.ndarray | None  # One score per region, None if the sample could not be compared.
+    error: str | None = None
+    transform: np.ndarray | None = None  # Alignment transform, if the sample was aligned.
+    alignmentSeconds: float = 0.0  # Time spent estimating the transform, zero if it was cached.
+
+
+class RegionIndex:
+    """Gather index over every pixel covered by a set of regions.
+
+    Pixel coordinates are stored relative to the bounding box of all regions, so
+    the index can be applied to a crop of that box as well as to a full image.
+
+    When the regions overlap so much that they cover more pixels than their
+    bounding box, no gather index is built; mean absolute differences are then
+    read from a summed-area table of the bounding box instead, which costs the
+    same however many regions there are."""
+
+    def __init__(self, shape: tuple[int, ...], regions: Iterable[Region]):
+        height, width = shape[:2]
+        self.regions = [region.clipped(width, height) for region in regions]
+        if not self.regions or any(region.isEmpty() for region in self.regions):
+            raise ValueError("Every region must overlap the reference image.")
+
+        self.boundingBox = boundingBox(self.regions)
+        x0, y0 = self.boundingBox.x, self.boundingBox.y
+        self.rectangles = np.array(
+            [(region.x - x0, region.y - y0, region.width, region.height) for region in self.regions], dtype=np.intp
+        )
+        self.counts = np.array([region.width * region.height for region in self.regions], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(self.counts)[:-1]))
+        self.useSummedAreaTable = int(self.counts.sum()) > self.boundingBox.width * self.boundingBox.height
+
+        self.yIndex = self.xIndex = np.empty(0, dtype=np.int32)
+        if self.useSummedAreaTable:
+            return
+        ys, xs = [], []
+        for region in self.regions:  # Runs once per set of regions, not per sample.
+            gridY, gridX = np.mgrid[
+                region.y - y0 : region.y - y0 + region.height,
+                region.x - x0 : region.x - x0 + region.width,
+            ]
+            ys.append(gridY.ravel())
+            xs.append(gridX.ravel())
+        self.yIndex = np.concatenate(ys).astype(np.int32)
+        self.xIndex = np.concatenate(xs).astype(np.int32)
+
+    def __len__(self) -> int:
+        return len(self.yIndex)
+
+    def crop(self, image: cv2.Mat) -> cv2.Mat:
+        box = self.boundingBox
+        return image[box.y : box.y + box.height, box.x : box.x + box.width]
+
+    def cropReference(self, reference: cv2.Mat) -> cv2.Mat:
+        """Crop the reference into its own contiguous array. The reference may be a rotated or mirrored view of
+        the stored image; this is where its pixels are materialized, for the bounding box only and once per run."""
+        return np.ascontiguousarray(self.crop(reference))
+
+    def gather(self, crop: cv2.Mat) -> np.ndarray:
+        """Return the region pixels of a bounding box crop as a (pixels, channels) array."""
+        pixels = crop[self.yIndex, self.xIndex]
+        return pixels.reshape(len(self), -1)
+
+
+def _differenceType(dtype: np.dtype) -> type[np.signedinteger]:
+    return np.int16 if dtype.itemsize == 1 else np.int32
+
+
+def scoreBatch(index: RegionIndex, referencePixels: np.ndarray, samplePixels: np.ndarray) -> np.ndarray:
+    """Mean absolute difference per region for a batch of gathered samples.
+
+    `referencePixels` is the (pixels, channels) output of `RegionIndex.gather` and
+    `samplePixels` stacks the same for each sample as (samples, pixels, channels).
+    Returns a (samples, regions) float array."""
+    differenceType = _differenceType(samplePixels.dtype)
+    difference = np.abs(samplePixels.astype(differenceType) - referencePixels.astype(differenceType))
+    perPixel = difference.sum(axis=2, dtype=np.int64)
+    perRegion = np.add.reduceat(perPixel, index.offsets, axis=1)
+    return perRegion / (index.counts * samplePixels.shape[2])
+
+
+def scoreRegions(index: RegionIndex, metric: str, referenceCrop: cv2.Mat, sampleCrop: cv2.Mat) -> np.ndarray:
+    """Score each region of a sample bounding box crop with one of the `metrics.METRICS`."""
+    if metric == "mad":
+        return differenceTable(referenceCrop, sampleCrop, squared=False).mean(index.rectangles).mean(axis=1)
+    function = METRICS[metric]
+    box = index.boundingBox
+    scores = np.empty(len(index.regions))
+    for i, region in enumerate(index.regions):
+        y, x = region.y - box.y, region.x - box.x
+        window = (slice(y, y + region.height), slice(x, x + region.width))
+        scores[i] = function(referenceCrop[window], sampleCrop[window])
+    return scores
+
+
+def iterCompareSamples(
+    reference: cv2.Mat,
+    regions: Iterable[Region],
+    samplePaths: Iterable[str],
+    batchSize: int = 32,
+    metric: str = "mad",
+    aligner: Aligner | None = None,
+) -> Iterator[SampleResult]:
+    """Compare each sample against the reference, yielding one result per sample in input order.
+
+    Samples are decoded one at a time. For the default mean absolute difference
+    they are reduced to their region pixels and scored `batchSize` at a time in a
+    single vectorized pass; other metrics, heavily overlapping regions and aligned
+    samples score each sample's regions as it loads. With an `aligner`, transforms
+    it has cached are reused and new ones added to its cache."""
+    index = RegionIndex(reference.shape, regions)
+    if aligner is not None:
+        yield from _iterCompareAligned(reference, index, samplePaths, metric, aligner)
+        return
+    if metric != "mad" or index.useSummedAreaTable:
+        referenceCrop = index.cropReference(reference)
+        for samplePath in samplePaths:
+            yield compareSample(samplePath, reference, index, metric, referenceCrop)
+        return
+
+    referencePixels = index.gather(index.cropReference(reference))
+
+    batch: list[str] = []
+    for samplePath in samplePaths:
+        batch.append(samplePath)
+        if len(batch) == batchSize:
+            yield from _compareBatch(reference, index, referencePixels, batch)
+            batch = []
+    if batch:
+        yield from _compareBatch(reference, index, referencePixels, batch)
+
+
+def compareSamples(
+    reference: cv2.Mat,
+    regions: Iterable[Region],
+    samplePaths: Iterable[str],
+    batchSize: int = 32,
+    metric: str = "mad",
+    aligner: Aligner | None = None,
+) -> list[SampleResult]:
+    return list(iterCompareSamples(reference, regions, samplePaths, batchSize, metric, aligner))
+
+
+def compareSample(
+    samplePath: str,
+    reference: cv2.Mat,
+    index: RegionIndex,
+    metric: str,
+    referenceCrop: cv2.Mat | None = None,
+    aligner: Aligner | None = None,
+    transform: np.ndarray | None = None,
+) -> SampleResult:
+    """Compare one sample, aligning it first if given an `aligner` and no known `transform`."""
+    if referenceCrop is None:
+        referenceCrop = index.cropReference(reference)
+    if aligner is None:
+        sampleCrop = loadSampleCrop(samplePath, reference, index)
+        if isinstance(sampleCrop, str):
+            return SampleResult(samplePath, None, sampleCrop)
+        return SampleResult(samplePath, scoreRegions(index, metric, referenceCrop, sampleCrop))
+
+    loaded = loadAlignedCrop(samplePath, reference, index, aligner, transform)
+    if isinstance(loaded, str):
+        return SampleResult(samplePath, None, loaded)
+    sampleCrop, transform, seconds = loaded
+    return SampleResult(samplePath, scoreRegions(index, metric, referenceCrop, sampleCrop), None, transform, seconds)
+
+
+def loadSampleCrop(samplePath: str, reference: cv2.Mat, index: RegionIndex) -> cv2.Mat | str:
+    """Decode only the regions' bounding box from a sample.
+    Returns an error message instead if the sample cannot be compared."""
+    box = index.boundingBox
+    loaded = getOpenCVImageRegion(samplePath, box.x, box.y, box.width, box.height)
+    if loaded is None:
+        return "Could not load image."
+    crop, shape = loaded
+    if shape != reference.shape or crop.dtype != reference.dtype:
+        return f"Image size {shape} does not match reference size {reference.shape}."
+    return crop
+
+
+def loadAlignedCrop(
+    samplePath: str, reference: cv2.Mat, index: RegionIndex, aligner: Aligner, transform: np.ndarray | None = None
+) -> tuple[cv2.Mat, np.ndarray, float] | str:
+    """Decode a sample, align it to the reference unless its `transform` is given and return its aligned bounding
+    box crop, the transform and the seconds spent estimating it. Returns an error message instead if the sample
+    cannot be compared."""
+    sample = getOpenCVImage(samplePath)  # Alignment looks at the whole image, so there is no region decode here.
+    if sample is None:
+        return "Could not load image."
+    if sample.shape != reference.shape or sample.dtype != reference.dtype:
+        return f"Image size {sample.shape} does not match reference size {reference.shape}."
+
+    seconds = 0.0
+    if transform is None:
+        start = time.perf_counter()
+        transform = aligner.estimate(sample)
+        seconds = time.perf_counter() - start
+    return warpRegion(sample, transform, index.boundingBox), transform, seconds
+
+
+def loadSamplePixels(samplePath: str, reference: cv2.Mat, index: RegionIndex) -> np.ndarray | str:
+    """Decode only what the regions need from a sample and gather their pixels.
+    Returns an error message instead if the sample cannot be compared."""
+    crop = loadSampleCrop(samplePath, reference, index)
+    return crop if isinstance(crop, str) else index.gather(crop)
+
+
+def _iterCompareAligned(
+    reference: cv2.Mat, index: RegionIndex, samplePaths: Iterable[str], metric: str, aligner: Aligner
+) -> Iterator[SampleResult]:
+    referenceCrop = index.cropReference(reference)
+    try:
+        for samplePath in samplePaths:
+            transform = aligner.cachedTransform(samplePath)
+            result = compareSample(samplePath, reference, index, metric, referenceCrop, aligner, transform)
+            if transform is None and result.transform is not None:
+                aligner.rememberTransform(samplePath, result.transform)
+            yield result
+    finally:
+        aligner.saveCache()
+
+
+def _compareBatch(
+    reference: cv2.Mat, index: RegionIndex, referencePixels: np.ndarray, samplePaths: list[str]
+) -> list[SampleResult]:
+    samplePixels = np.empty((len(samplePaths), *referencePixels.shape), dtype=reference.dtype)
+    errors: dict[int, str] = {}
+    loaded = 0
+    for i, samplePath in enumerate(samplePaths):
+        pixels = loadSamplePixels(samplePath, reference, index)
+        if isinstance(pixels, str):
+            errors[i] = pixels
+        else:
+            samplePixels[loaded] = pixels
+            loaded += 1
+
+    scores = iter(scoreBatch(index, referencePixels, samplePixels[:loaded]))
+    return [
+        SampleResult(samplePath, None, errors[i]) if i in errors else SampleResult(samplePath, next(scores))
+        for i, samplePath in enumerate(samplePaths)
+    ]
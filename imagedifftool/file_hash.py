@@ -0,0 +1,47 @@
+"""File states and content hashes, shared by the caches and the result database."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from typing import NamedTuple
+
+
+class CacheKey(NamedTuple):
+    """A file as it is now: an edit changes its modification time or size."""
+
+    filePath: str
+    mtime: int  # Nanoseconds.
+    size: int
+
+    @classmethod
+    def fromFile(cls, filePath: str) -> CacheKey | None:
+        try:
+            stat = os.stat(filePath)
+        except OSError:
+            return None
+        return cls(os.path.abspath(filePath), stat.st_mtime_ns, stat.st_size)
+
+
+_hashes: dict[CacheKey, str] = {}  # Remembered for the life of the process.
+_lock = threading.Lock()
+
+
+def fileHash(filePath: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filePath, "rb") as file:
+        while chunk := file.read(2**20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cachedFileHash(key: CacheKey) -> str:
+    """Return the content hash of the file of `key`, reading it unless it was hashed in this state before."""
+    with _lock:
+        contentHash = _hashes.get(key)
+    if contentHash is None:
+        contentHash = fileHash(key.filePath)
+        with _lock:
+            _hashes[key] = contentHash
+    return contentHash
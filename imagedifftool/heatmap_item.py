@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from tiled_image_item import TILE_SIZE, TiledImageItem
+
+if TYPE_CHECKING:
+    import cv2
+    from image_tools import ImagePyramid
+
+
+class HeatmapItem(TiledImageItem):
+    """Colormapped absolute difference between a sample and the reference, drawn over the reference.
+
+    Tiles are computed from the matching levels of both pyramids the first time
+    they are exposed, so only the part of the image in view is ever diffed, at
+    the resolution it is shown at, and panning only diffs the tiles scrolling in.
+    Unchanged pixels are transparent; the more a pixel differs, the more opaque
+    and brighter it is drawn."""
+
+    TILE_SPAN = "heatmap tile"
+    GAIN = 4  # Most differences are a small part of the value range; scale them up before the colormap.
+
+    def __init__(self):
+        super().__init__()
+
+        self.samplePyramid: ImagePyramid | None = None
+
+    def setPyramids(self, reference: ImagePyramid | None, sample: ImagePyramid | None) -> bool:
+        """Show the difference of `sample` to `reference`. Returns False, showing nothing, if their sizes differ."""
+        if reference is None or sample is None or reference.levels[0].shape != sample.levels[0].shape:
+            self.samplePyramid = None
+            self.setPyramid(None)
+            return reference is None or sample is None
+        self.samplePyramid = sample
+        self.setPyramid(reference)
+        return True
+
+    def tileImage(self, level: int, column: int, row: int) -> cv2.Mat:
+        import cv2
+        import numpy as np
+
+        assert self.pyramid is not None and self.samplePyramid is not None
+        x, y = column * TILE_SIZE, row * TILE_SIZE
+        window = (slice(y, y + TILE_SIZE), slice(x, x + TILE_SIZE))
+        difference = cv2.absdiff(self.pyramid.levels[level][window], self.samplePyramid.levels[level][window])
+        if difference.ndim == 3:
+            difference = difference.max(axis=2)  # A pixel differs as much as its most different channel.
+        maxValue = np.iinfo(difference.dtype).max if difference.dtype.kind in "iu" else 1.0
+        difference = cv2.convertScaleAbs(difference, alpha=self.GAIN * 255 / maxValue)
+
+        heatmap = cv2.cvtColor(cv2.applyColorMap(difference, cv2.COLORMAP_INFERNO), cv2.COLOR_BGR2BGRA)
+        heatmap[..., 3] = difference
+        return heatmap
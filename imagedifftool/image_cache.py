@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterable
+
+from file_hash import CacheKey
+
+if TYPE_CHECKING:
+    from image_tools import ImagePyramid
+
+
+class ImageCache:
+    """Thread-safe LRU cache of decoded images, bounded by the bytes they occupy.
+
+    Entries are keyed by path, modification time and size, so an edited file is
+    decoded again. Each entry is the image's display pyramid, whose level 0 is the
+    decoded image itself."""
+
+    def __init__(self, maxBytes: int = 1024 * 2**20, prefetchWorkers: int = 2):
+        self.maxBytes = maxBytes
+        self.currentBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.entries: OrderedDict[CacheKey, ImagePyramid] = OrderedDict()
+        self.lock = threading.Lock()
+        self.prefetchExecutor = ThreadPoolExecutor(prefetchWorkers, thread_name_prefix="ImageCachePrefetch")
+
+    def __str__(self) -> str:
+        return (
+            f"{len(self.entries)} image(s), {self.currentBytes / 2**20:.0f}/{self.maxBytes / 2**20:.0f} MiB, "
+            f"{self.hits} hit(s), {self.misses} miss(es), {self.evictions} eviction(s)"
+        )
+
+    def getPyramid(self, filePath: str) -> ImagePyramid | None:
+        """Return the cached pyramid for a file, decoding and caching it on a miss.
+        Returns None if the file cannot be read."""
+        key = CacheKey.fromFile(filePath)
+        if key is None:
+            return None
+
+        with self.lock:
+            pyramid = self.entries.get(key)
+            if pyramid is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return pyramid
+            self.misses += 1
+
+        from image_tools import ImagePyramid, getOpenCVImage
+
+        openCVImage = getOpenCVImage(filePath)  # Decode outside the lock so other lookups are not held up.
+        if openCVImage is None:
+            return None
+        pyramid = ImagePyramid(openCVImage)
+        self.put(key, pyramid)
+        return pyramid
+
+    def put(self, key: CacheKey, pyramid: ImagePyramid):
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.currentBytes -= previous.nbytes
+            self.entries[key] = pyramid
+            self.currentBytes += pyramid.nbytes
+            self.evict()
+
+    def evict(self):
+        while self.currentBytes > self.maxBytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.currentBytes -= evicted.nbytes
+            self.evictions += 1
+
+    def setMaxBytes(self, maxBytes: int):
+        with self.lock:
+            self.maxBytes = maxBytes
+            self.evict()
+
+    def contains(self, filePath: str) -> bool:
+        key = CacheKey.fromFile(filePath)
+        with self.lock:
+            return key in self.entries
+
+    def prefetch(self, filePaths: Iterable[str]):
+        """Decode files into the cache in the background."""
+        for filePath in filePaths:
+            if not self.contains(filePath):
+                self.prefetchExecutor.submit(self.getPyramid, filePath)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.currentBytes = 0
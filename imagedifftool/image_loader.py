@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from profiling import span
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+from qt_image_tools import openCVToQImage
+
+if TYPE_CHECKING:
+    from image_cache import ImageCache
+    from image_tools import ImagePyramid
+
+
+class ImageLoaderSignals(QObject):
+    loadedSignal = pyqtSignal(int, object, object)
+    failedSignal = pyqtSignal(int, str)
+
+
+class ImageLoader(QRunnable):
+    """Decodes an image file and builds its pyramid off the GUI thread.
+
+    `generation` is handed back with the result so the receiver can tell whether
+    a newer load has superseded this one."""
+
+    def __init__(self, generation: int, filePath: str, imageCache: ImageCache | None = None):
+        super().__init__()
+
+        self.generation = generation
+        self.filePath = filePath
+        self.imageCache = imageCache
+        self.cancelled = False
+        self.signals = ImageLoaderSignals()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        if self.cancelled:
+            return
+        with span("load"):
+            pyramid = self.loadPyramid()
+        if self.cancelled:
+            return
+        if pyramid is None:
+            self.signals.failedSignal.emit(self.generation, self.filePath)
+            return
+
+        image = openCVToQImage(pyramid.levels[0])
+        self.signals.loadedSignal.emit(self.generation, pyramid, image)
+
+    def loadPyramid(self) -> ImagePyramid | None:
+        if self.imageCache is not None:
+            return self.imageCache.getPyramid(self.filePath)
+
+        from image_tools import ImagePyramid, getOpenCVImage
+
+        openCVImage = getOpenCVImage(self.filePath)
+        if openCVImage is None or self.cancelled:
+            return None
+        return ImagePyramid(openCVImage)
@@ -0,0 +1,90 @@
+"""Store of pre-decoded images, memory-mapped by later runs over the same samples."""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Iterable
+
+import cv2
+import numpy as np
+
+
+class ImageStore:
+    INDEX_NAME = "index.json"
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.indexPath = self.directory / self.INDEX_NAME
+        self.lock = threading.Lock()
+        self.index: dict[str, dict[str, int | str]] = {}
+        if self.indexPath.exists():
+            self.index = json.loads(self.indexPath.read_text())
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def entryPath(self, filePath: str) -> Path | None:
+        """Return the stored file for an image, or None if it is missing or older than the image."""
+        entry = self.index.get(os.path.abspath(filePath))
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(filePath)
+        except OSError:
+            return None
+        if entry["mtime"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            return None
+        return self.directory / str(entry["file"])
+
+    def get(self, filePath: str) -> np.ndarray | None:
+        """Return a read-only memory map of the stored image, or None if there is no fresh entry."""
+        entryPath = self.entryPath(filePath)
+        if entryPath is None:
+            return None
+        try:
+            return np.load(entryPath, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+    def ingest(self, filePaths: Iterable[str], progress: Callable[[str, bool], None] | None = None) -> int:
+        """Decode images into the store, skipping those with a fresh entry.
+        Returns the number of images decoded; `progress` is called with each path and whether it succeeded."""
+        ingested = 0
+        for filePath in filePaths:
+            if Path(filePath).suffix.lower() == ".npy" or self.entryPath(filePath) is not None:
+                continue  # NumPy files are memory-mapped directly and gain nothing from a stored copy.
+            succeeded = self.ingestOne(filePath)
+            ingested += succeeded
+            if progress is not None:
+                progress(filePath, succeeded)
+        self.saveIndex()
+        return ingested
+
+    def ingestOne(self, filePath: str) -> bool:
+        fullPath = os.path.abspath(filePath)
+        try:
+            stat = os.stat(fullPath)
+        except OSError:
+            return False
+        openCVImage = cv2.imread(fullPath)
+        if openCVImage is None:
+            return False
+
+        fileName = hashlib.blake2b(fullPath.encode(), digest_size=16).hexdigest() + ".npy"
+        temporaryPath = self.directory / f"{fileName}.{threading.get_ident()}.tmp"
+        with open(temporaryPath, "wb") as file:
+            np.save(file, openCVImage)
+        os.replace(temporaryPath, self.directory / fileName)
+
+        with self.lock:
+            self.index[fullPath] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "file": fileName}
+        return True
+
+    def saveIndex(self):
+        with self.lock:
+            temporaryPath = self.indexPath.with_name(f"{self.INDEX_NAME}.tmp")
+            temporaryPath.write_text(json.dumps(self.index))
+            os.replace(temporaryPath, self.indexPath)
@@ -1,30 +1,187 @@
+import copy
+import math
+import os
+import re
+import struct
+from pathlib import Path
+from typing import Callable
+
 import cv2
-from PyQt6.QtGui import QImage, QIcon, QPixmap
+import numpy as np
+from image_store import ImageStore
+from orientation import Orientation
+
+_imageStore: ImageStore | None = None
+
+
+def setImageStore(imageStore: ImageStore | None):
+    """Serve images from a pre-decoded store whenever it has a fresh entry for them."""
+    global _imageStore
+    _imageStore = imageStore
+
+
+def getImageStore() -> ImageStore | None:
+    return _imageStore
 
 
 def getOpenCVImage(filePath: str) -> cv2.Mat:
+    if _imageStore is not None:
+        stored = _imageStore.get(filePath)
+        if stored is not None:
+            return stored
     return cv2.imread(filePath)
 
 
-def toGrayScale(openCVImage: cv2.Mat) -> cv2.Mat:
-    return cv2.cvtColor(openCVImage, cv2.COLOR_BGR2GRAY)
+def getOpenCVImageRegion(
+    filePath: str, x: int, y: int, width: int, height: int
+) -> tuple[cv2.Mat, tuple[int, ...]] | None:
+    """Return the given rectangle of an image as BGR, along with the shape of the full image.
+
+    Images in the image store and uncompressed formats (NumPy .npy, binary PGM/PPM,
+    uncompressed 24-bit BMP) are memory-mapped so only the rows of the rectangle
+    are read; anything else is decoded in full and cropped. Returns None if the
+    file cannot be read."""
+    stored = _imageStore.get(filePath) if _imageStore is not None else None
+    if stored is not None:
+        mapped = stored, None
+    else:
+        reader = _MAPPED_READERS.get(Path(filePath).suffix.lower())
+        mapped = reader(filePath) if reader is not None else None
+    if mapped is None:
+        openCVImage = getOpenCVImage(filePath)
+        if openCVImage is None:
+            return None
+        return openCVImage[y : y + height, x : x + width], openCVImage.shape
+
+    pixels, conversion = mapped
+    crop = np.ascontiguousarray(pixels[y : y + height, x : x + width])
+    if conversion is not None:
+        crop = cv2.cvtColor(crop, conversion)
+    return crop, (*pixels.shape[:2], 3)
+
+
+def _mapNpy(filePath: str) -> tuple[np.ndarray, int | None] | None:
+    try:
+        pixels = np.load(filePath, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    if pixels.ndim == 2:
+        return pixels, cv2.COLOR_GRAY2BGR
+    if pixels.ndim == 3 and pixels.shape[2] == 3:
+        return pixels, None
+    return None
+
+
+_PNM_HEADER = re.compile(rb"(P[56])(?:\s+|#[^\n]*\n)+(\d+)(?:\s+|#[^\n]*\n)+(\d+)(?:\s+|#[^\n]*\n)+(\d+)\s")
+
+
+def _mapPnm(filePath: str) -> tuple[np.ndarray, int | None] | None:
+    try:
+        with open(filePath, "rb") as file:
+            header = _PNM_HEADER.match(file.read(512))
+            fileSize = os.fstat(file.fileno()).st_size
+        if header is None or int(header[4]) > 255:  # 16-bit files are scaled to 8-bit by imread; leave that to it.
+            return None
+        magic, width, height = header[1], int(header[2]), int(header[3])
+        channels = 3 if magic == b"P6" else 1
+        if width <= 0 or height <= 0 or fileSize < header.end() + height * width * channels:
+            return None
+        shape = (height, width, channels) if channels == 3 else (height, width)
+        pixels = np.memmap(filePath, dtype=np.uint8, mode="r", offset=header.end(), shape=shape)
+    except (OSError, ValueError):
+        return None
+    return pixels, cv2.COLOR_RGB2BGR if channels == 3 else cv2.COLOR_GRAY2BGR
+
+
+def _mapBmp(filePath: str) -> tuple[np.ndarray, int | None] | None:
+    try:
+        with open(filePath, "rb") as file:
+            header = file.read(34)
+            fileSize = os.fstat(file.fileno()).st_size
+        if len(header) < 34 or header[:2] != b"BM":
+            return None
+        (offset,) = struct.unpack_from("<I", header, 10)
+        width, height, _, bitsPerPixel, compression = struct.unpack_from("<iiHHI", header, 18)
+        if bitsPerPixel != 24 or compression != 0 or width <= 0 or height == 0:
+            return None
+        rowBytes = (width * 3 + 3) & ~3
+        if fileSize < offset + abs(height) * rowBytes:  # Truncated, or the header lies.
+            return None
+        rows = np.memmap(filePath, dtype=np.uint8, mode="r", offset=offset, shape=(abs(height), rowBytes))
+    except (OSError, ValueError):
+        return None
+    pixels = np.lib.stride_tricks.as_strided(rows, shape=(abs(height), width, 3), strides=(rowBytes, 3, 1))
+    return (pixels[::-1] if height > 0 else pixels), None  # Positive heights are stored bottom-up.
+
+
+_MAPPED_READERS: dict[str, Callable[[str], tuple[np.ndarray, int | None] | None]] = {
+    ".npy": _mapNpy,
+    ".pgm": _mapPnm,
+    ".ppm": _mapPnm,
+    ".pnm": _mapPnm,
+    ".bmp": _mapBmp,
+}
 
 
-def openCVToQImage(openCVImage: cv2.Mat) -> QImage:
-    return QImage(openCVImage.data, openCVImage.shape[1], openCVImage.shape[0], QImage.Format.Format_BGR888)
+def toGrayScale(openCVImage: cv2.Mat) -> cv2.Mat:
+    return cv2.cvtColor(openCVImage, cv2.COLOR_BGR2GRAY)
 
 
+# Rotations and flips return views sharing the pixels of the input; OpenCV functions accept them as they are.
 def rotateClockwise(openCVImage: cv2.Mat) -> cv2.Mat:
-    return cv2.rotate(openCVImage, cv2.ROTATE_90_CLOCKWISE)
+    return np.rot90(openCVImage, -1)
 
 
 def rotateCounterClockwise(openCVImage: cv2.Mat) -> cv2.Mat:
-    return cv2.rotate(openCVImage, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return np.rot90(openCVImage)
+
+
+def flipHorizontal(openCVImage: cv2.Mat) -> cv2.Mat:
+    return openCVImage[:, ::-1]
+
+
+def flipVertical(openCVImage: cv2.Mat) -> cv2.Mat:
+    return openCVImage[::-1]
+
+
+class ImagePyramid:
+    """An OpenCV image plus successively halved copies of it; level 0 is the full resolution."""
+
+    def __init__(self, openCVImage: cv2.Mat, minimumSize: int = 512):
+        self.levels = [openCVImage]
+        while max(self.levels[-1].shape[:2]) > minimumSize:
+            previous = self.levels[-1]
+            size = (max(previous.shape[1] // 2, 1), max(previous.shape[0] // 2, 1))
+            self.levels.append(cv2.resize(previous, size, interpolation=cv2.INTER_AREA))
+
+    @property
+    def width(self) -> int:
+        return self.levels[0].shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.levels[0].shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(level.nbytes for level in self.levels)
+
+    def oriented(self, orientation: Orientation) -> "ImagePyramid":
+        """Return the pyramid turned and mirrored as `orientation` says, each level a view of these pixels."""
+        pyramid = copy.copy(self)
+        pyramid.levels = [orientation.apply(level) for level in self.levels]
+        return pyramid
 
+    def levelForScale(self, scale: float) -> int:
+        """Return the coarsest level that still has at least one pixel per device pixel at `scale`."""
+        if scale >= 1:
+            return 0
+        return min(int(math.log2(1 / scale)), len(self.levels) - 1)
 
-def getIconFromSvg(svgStr: str) -> QIcon:
-    pixmap = QPixmap.fromImage(QImage.fromData(svgStr.encode()))  # type: ignore
-    return QIcon(pixmap)
+    def levelScale(self, level: int) -> tuple[float, float]:
+        """Return the factors that map level pixel coordinates to level 0 coordinates."""
+        image = self.levels[level]
+        return self.width / image.shape[1], self.height / image.shape[0]
 
 
 def debugShowOpenCVImage(openCVImage: cv2.Mat):
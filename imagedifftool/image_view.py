@@ -1,20 +1,27 @@
-from pathlib import Path
+from __future__ import annotations
 
-import cv2
-from image_tools import (
-    debugShowOpenCVImage,
-    debugShowOpenCVImageRect,
-    getOpenCVImage,
-    openCVToQImage,
-    rotateClockwise,
-    rotateCounterClockwise,
+import math
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from heatmap_item import HeatmapItem
+from image_loader import ImageLoader
+from orientation import Orientation
+from profiling import timed
+from PyQt6.QtCore import QEvent, QPointF, QRect, QRectF, Qt, QThreadPool, QTimer, pyqtSignal, pyqtSlot
+from PyQt6.QtGui import (
+    QBrush,
+    QColor,
+    QDragEnterEvent,
+    QDropEvent,
+    QImage,
+    QKeyEvent,
+    QMouseEvent,
+    QTransform,
+    QWheelEvent,
 )
-from PyQt6.QtCore import QEvent, QPointF, QRect, Qt, QTimer, pyqtSignal, pyqtSlot, QPropertyAnimation
-from PyQt6.QtGui import QBrush, QColor, QDragEnterEvent, QDropEvent, QImage, QMouseEvent, QPixmap, QWheelEvent
 from PyQt6.QtWidgets import (
     QFrame,
-    QGraphicsPixmapItem,
-    QGraphicsRectItem,
     QGraphicsScene,
     QGraphicsView,
     QLabel,
@@ -23,8 +30,18 @@ from PyQt6.QtWidgets import (
     QVBoxLayout,
     QWidget,
 )
+from qt_image_tools import openCVToQImage
+from region import Region
+from region_model import RegionModel
+from regions_item import RegionsItem
+from tiled_image_item import TiledImageItem
+from undo_stack import UndoStack
+from view_commands import AddRegionCommand, CropCommand, MoveRegionCommand, OrientationCommand, RemoveRegionCommand
 
-from d import d
+if TYPE_CHECKING:
+    import cv2
+    from image_cache import ImageCache
+    from image_tools import ImagePyramid
 
 
 class DropHere(QLabel):
@@ -36,15 +53,13 @@ class DropHere(QLabel):
         self.setAcceptDrops(True)
         self.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.setText("Drop Here")
-        self.setStyleSheet(
-            """
+        self.setStyleSheet("""
             QLabel {
                 border: 2px dashed #aaa;
                 color: #999;
                 font-size: 20px;
             }
-            """
-        )
+            """)
 
     def dragEnterEvent(self, a0: QDragEnterEvent):
         if a0.mimeData().hasImage:
@@ -65,14 +80,28 @@ class ImageView(QGraphicsView):
     zoomChangedSignal = pyqtSignal(int)
     positionChangedSignal = pyqtSignal(QPointF)
     imageChangedSignal = pyqtSignal(QImage)
+    regionsChangedSignal = pyqtSignal()
+    orientationChangedSignal = pyqtSignal()
+    TOOLS = ("pointer", "select", "move")
 
-    def __init__(self):
+    def __init__(self, imageCache: ImageCache | None = None):
         super().__init__()
 
+        self.imageCache = imageCache
         self.currentZoom = self.MINIMUM_ZOOM
         self.prevFromScenePoint: QPointF
         self.prevToScenePoint: QPointF
         self.openCVImage: cv2.Mat
+        self.sourcePyramid: ImagePyramid | None = None  # As loaded, before any crop.
+        self.cropOrigin = (0, 0)  # Where the shown image starts in the loaded one.
+        self.filePath: str | None = None
+        self.regionModel = RegionModel()
+        self.orientation = Orientation()
+        self.undoStack = UndoStack()
+        self.tool = "select"
+        self.moveStart: tuple[QPointF, int, Region] | None = None  # Press position, id and region of a move.
+        self.imageLoader: ImageLoader | None = None
+        self.imageGeneration = 0
 
         self.initUI()
 
@@ -87,55 +116,166 @@ class ImageView(QGraphicsView):
 
         self.setScene(QGraphicsScene(self))
 
-        self.pixmapItem = QGraphicsPixmapItem()
-        self.pixmapItem.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
-        self.pixmapItem.setFlags(QGraphicsPixmapItem.GraphicsItemFlag.ItemClipsChildrenToShape)
+        self.imageItem = TiledImageItem()
+        self.imageItem.setFlag(TiledImageItem.GraphicsItemFlag.ItemClipsChildrenToShape)
+
+        self.scene().addItem(self.imageItem)
+
+        self.heatmapItem = HeatmapItem()
+        self.heatmapItem.setParentItem(self.imageItem)
+        self.heatmapItem.setZValue(-1)  # Below the regions.
+        self.heatmapItem.setOpacity(0.5)
 
-        self.scene().addItem(self.pixmapItem)
+        self.regionsItem = RegionsItem(self.regionModel)
+        self.regionsItem.setParentItem(self.imageItem)
 
         self.rubberBandChanged.connect(self.addRectToScene)  # pyright: reportFunctionMemberAccess=false
 
     @pyqtSlot(QRect, QPointF, QPointF)
     def addRectToScene(self, rubberBandRect: QRect, fromScenePoint: QPointF, toScenePoint: QPointF):
         if rubberBandRect.isNull():  # Selection stopped.
-            graphicsRectItem = QGraphicsRectItem(
-                self.prevFromScenePoint.x(),
-                self.prevFromScenePoint.y(),
-                self.prevToScenePoint.x() - self.prevFromScenePoint.x(),
-                self.prevToScenePoint.y() - self.prevFromScenePoint.y(),
-            )
-            graphicsRectItem.setParentItem(self.pixmapItem)
-            graphicsRectItem.setPen(QColor(0, 255, 0))
-
-            rect = graphicsRectItem.rect().toRect()
-            debugShowOpenCVImageRect(
-                self.openCVImage, (rect.x(), rect.y()), (rect.x() + rect.width(), rect.y() + rect.height())
-            )
-
+            if self.imageItem.isNull():
+                return
+            rect = QRectF(self.prevFromScenePoint, self.prevToScenePoint).normalized().toRect()
+            region = Region(rect.x(), rect.y(), rect.width(), rect.height())
+            region = region.clipped(self.imageItem.pyramid.width, self.imageItem.pyramid.height)
+            if not region.isEmpty():
+                self.undoStack.push(AddRegionCommand(self, region))
         else:
             self.prevFromScenePoint = fromScenePoint
             self.prevToScenePoint = toScenePoint
 
-    def setImage(self, filePath: str) -> bool:
-        """Set the image to be displayed in the view.
-        Returns True if the image was successfully loaded, False otherwise."""
+    @property
+    def regions(self) -> list[Region]:
+        return self.regionModel.regions()
+
+    def addRegion(self, region: Region, regionId: int | None = None) -> int:
+        regionId = self.regionModel.add(region, regionId)
+        self.regionsItem.updateRegion(region)
+        self.regionsChangedSignal.emit()
+        return regionId
+
+    def removeRegion(self, regionId: int) -> Region:
+        region = self.regionModel.remove(regionId)
+        if regionId == self.regionsItem.selectedRegionId:
+            self.regionsItem.setSelectedRegionId(None)
+        self.regionsItem.updateRegion(region)
+        self.regionsChangedSignal.emit()
+        return region
+
+    def moveRegion(self, regionId: int, region: Region):
+        self.regionsItem.updateRegion(self.regionModel.region(regionId))
+        self.regionModel.replace(regionId, region)
+        self.regionsItem.updateRegion(region)
+        self.regionsChangedSignal.emit()
+
+    def selectRegion(self, regionId: int | None):
+        self.regionsItem.setSelectedRegionId(regionId)
+
+    @property
+    def selectedRegionId(self) -> int | None:
+        return self.regionsItem.selectedRegionId
+
+    def setTool(self, tool: str):
+        """Switch the left mouse button between selecting regions ("pointer"), drawing them and moving them."""
+        if tool not in self.TOOLS:
+            raise ValueError(f"Unknown tool {tool!r}.")
+        self.tool = tool
+        dragMode = QGraphicsView.DragMode.RubberBandDrag if tool == "select" else QGraphicsView.DragMode.NoDrag
+        self.setDragMode(dragMode)
+
+    def cropToSelection(self) -> bool:
+        """Crop the image to the selected region, keeping the parts of the regions inside it.
+        Returns False if no region is selected."""
+        regionId = self.selectedRegionId
+        if regionId is None or self.imageItem.isNull():
+            return False
+        self.undoStack.push(CropCommand(self, self.regionModel.region(regionId)))
+        return True
 
-        fullPath = Path(filePath).resolve().as_posix()
+    def showImage(
+        self,
+        pyramid: ImagePyramid,
+        records: dict[int, Region],
+        selectedRegionId: int | None,
+        cropOrigin: tuple[int, int] = (0, 0),
+    ):
+        """Show another version of the loaded image, e.g. the crop of it starting at `cropOrigin`, with the given
+        regions."""
+        self.openCVImage = pyramid.levels[0]
+        self.cropOrigin = cropOrigin
+        self.showPyramid(pyramid)
+        for regionId, region in sorted(records.items()):
+            self.regionModel.add(region, regionId)
+        self.selectRegion(selectedRegionId)
+        self.regionsChangedSignal.emit()
+        self.imageChangedSignal.emit(openCVToQImage(self.openCVImage))
 
-        self.openCVImage = getOpenCVImage(fullPath)
-        if self.openCVImage is None:
-            QMessageBox.critical(self, "Error", "Could not load image. Image may be corrupt or unsupported.")
-            return False
+    def setImage(self, filePath: str):
+        """Start loading the image to be displayed in the view.
+        The image is decoded on a worker thread; `imageChangedSignal` is emitted once it is shown.
+        A load still in flight is cancelled and its result discarded."""
+
+        if self.imageLoader is not None:
+            self.imageLoader.cancel()
+
+        self.imageGeneration += 1
+        self.imageLoader = ImageLoader(self.imageGeneration, Path(filePath).resolve().as_posix(), self.imageCache)
+        self.imageLoader.signals.loadedSignal.connect(self.onImageLoaded)
+        self.imageLoader.signals.failedSignal.connect(self.onImageLoadFailed)
+        QThreadPool.globalInstance().start(self.imageLoader)
+
+    @pyqtSlot(int, object, object)
+    def onImageLoaded(self, generation: int, pyramid: ImagePyramid, image: QImage):
+        if generation != self.imageGeneration:  # Superseded by a newer load.
+            return
+        self.filePath = self.imageLoader.filePath
+        self.imageLoader = None
+
+        self.openCVImage = pyramid.levels[0]
+        self.sourcePyramid = pyramid
+        self.cropOrigin = (0, 0)
+        self.showPyramid(pyramid)
+        self.undoStack.clear()  # Edits of the previous image do not apply to this one.
+        self.regionsChangedSignal.emit()
+        self.imageChangedSignal.emit(image)
 
-        image = openCVToQImage(self.openCVImage)
-        self.pixmapItem.setPixmap(QPixmap.fromImage(image))
+    def showPyramid(self, pyramid: ImagePyramid):
+        """Show a new image, without regions."""
+        self.regionModel.clear()
+        self.regionsItem.setSelectedRegionId(None)
+        self.regionsItem.setSize(pyramid.width, pyramid.height)
+        self.imageItem.setPyramid(pyramid)
+        self.heatmapItem.setPyramids(None, None)
         QTimer.singleShot(0, self.zoomFit)
-        self.scene().setSceneRect(self.pixmapItem.boundingRect())
+        self.scene().setSceneRect(self.imageItem.boundingRect())
 
-        self.imageChangedSignal.emit(image)
-        return True
+    @pyqtSlot(int, str)
+    def onImageLoadFailed(self, generation: int, filePath: str):
+        if generation != self.imageGeneration:
+            return
+        self.imageLoader = None
+        QMessageBox.critical(self, "Error", "Could not load image. Image may be corrupt or unsupported.")
+
+    def setDifferencePyramid(self, pyramid: ImagePyramid | None) -> bool:
+        """Overlay the difference of `pyramid`, a sample matching the image as displayed, as a heatmap, or remove it
+        for None. Returns False if the sizes do not match."""
+        x, y = self.cropOrigin
+        self.heatmapItem.setPos(-x, -y)  # The samples match the loaded image; the crop clips the heatmap.
+        return self.heatmapItem.setPyramids(self.sourcePyramid, self.storedFramePyramid(pyramid))
+
+    def storedFramePyramid(self, pyramid: ImagePyramid | None) -> ImagePyramid | None:
+        """Turn a sample matching the image as displayed back to the loaded image's orientation, like the items."""
+        if pyramid is None or self.orientation.isIdentity():
+            return pyramid
+        return pyramid.oriented(self.orientation.inverted())
+
+    @pyqtSlot(int)
+    def setHeatmapOpacity(self, percent: int):
+        self.heatmapItem.setOpacity(percent / 100)
 
     @pyqtSlot()
+    @timed("zoom")
     def zoomIn(self):
         self.currentZoom += 1
         if self.currentZoom > self.MAXIMUM_ZOOM:
@@ -145,6 +285,7 @@ class ImageView(QGraphicsView):
         self.zoomChangedSignal.emit(self.currentZoom)
 
     @pyqtSlot()
+    @timed("zoom")
     def zoomOut(self):
         self.currentZoom -= 1
         if self.currentZoom <= self.MINIMUM_ZOOM:
@@ -155,10 +296,11 @@ class ImageView(QGraphicsView):
         self.zoomChangedSignal.emit(self.currentZoom)
 
     @pyqtSlot()
+    @timed("zoom")
     def zoomFit(self):
         self.currentZoom = self.MINIMUM_ZOOM
         self.zoomChangedSignal.emit(self.currentZoom)
-        self.fitInView(self.pixmapItem, Qt.AspectRatioMode.KeepAspectRatio)
+        self.fitInView(self.imageItem, Qt.AspectRatioMode.KeepAspectRatio)
 
     @pyqtSlot(int)
     def setZoomFromSlider(self, value: int):
@@ -167,16 +309,57 @@ class ImageView(QGraphicsView):
         elif value <= self.currentZoom:
             self.zoomOut()
 
+    def setOrientation(self, orientation: Orientation):
+        """Show the image rotated or mirrored. Only the view transform changes; the pixels are never touched."""
+        self.orientation = orientation
+        scale = math.sqrt(abs(self.transform().determinant()))
+        transform = QTransform().rotate(90 * orientation.quarterTurns)
+        if orientation.mirrored:
+            transform = QTransform.fromScale(-1, 1) * transform
+        self.setTransform(transform * QTransform.fromScale(scale, scale))
+        self.orientationChangedSignal.emit()
+
     @pyqtSlot()
     def rotateClockwise(self):
-        self.rotate(90)
+        self.undoStack.push(OrientationCommand(self, "Rotate Clockwise", self.orientation.rotatedClockwise()))
 
     @pyqtSlot()
     def rotateCounterClockwise(self):
-        self.rotate(-90)
+        orientation = self.orientation.rotatedCounterClockwise()
+        self.undoStack.push(OrientationCommand(self, "Rotate Counter Clockwise", orientation))
+
+    @pyqtSlot()
+    def flipHorizontal(self):
+        self.undoStack.push(OrientationCommand(self, "Flip Horizontal", self.orientation.flippedHorizontally()))
+
+    @pyqtSlot()
+    def flipVertical(self):
+        self.undoStack.push(OrientationCommand(self, "Flip Vertical", self.orientation.flippedVertically()))
+
+    def sourceRegions(self) -> list[Region]:
+        """The regions in the coordinates of the loaded image, before any crop."""
+        x, y = self.cropOrigin
+        return [region.translated(x, y) for region in self.regions]
+
+    def croppedRegions(self, regions: list[Region]) -> list[Region]:
+        """Map regions of the loaded image to the image shown, dropping those outside the crop."""
+        x, y = self.cropOrigin
+        width, height = self.imageItem.pyramid.width, self.imageItem.pyramid.height
+        cropped = [region.translated(-x, -y).clipped(width, height) for region in regions]
+        return [region for region in cropped if not region.isEmpty()]
+
+    def orientedImage(self) -> cv2.Mat:
+        """The loaded image, uncropped so it matches the samples, in the orientation displayed. A view of the stored
+        pixels."""
+        return self.orientation.apply(self.sourcePyramid.levels[0])
+
+    def orientedRegions(self) -> list[Region]:
+        """The regions in the coordinates of `orientedImage`."""
+        height, width = self.sourcePyramid.levels[0].shape[:2]
+        return [self.orientation.mapRegion(region, width, height) for region in self.sourceRegions()]
 
     def wheelEvent(self, event: QWheelEvent):
-        if self.pixmapItem.pixmap().isNull():
+        if self.imageItem.isNull():
             return
 
         if event.angleDelta().y() > 0:
@@ -188,6 +371,14 @@ class ImageView(QGraphicsView):
         if not self.currentZoom:
             return super().mousePressEvent(event)
 
+        if event.button() == Qt.MouseButton.LeftButton and self.tool != "select" and not self.imageItem.isNull():
+            position = self.mapToScene(event.pos())
+            regionId = self.regionModel.regionAt(position.x(), position.y())
+            self.selectRegion(regionId)
+            if self.tool == "move" and regionId is not None:
+                self.moveStart = (position, regionId, self.regionModel.region(regionId))
+            return
+
         if event.button() == Qt.MouseButton.RightButton:
             self.setDragMode(QGraphicsView.DragMode.ScrollHandDrag)
             modifiedEvent = QMouseEvent(
@@ -204,8 +395,16 @@ class ImageView(QGraphicsView):
         if not self.currentZoom:
             return super().mouseReleaseEvent(event)
 
+        if event.button() == Qt.MouseButton.LeftButton and self.moveStart is not None:
+            _, regionId, previous = self.moveStart
+            self.moveStart = None
+            region = self.regionModel.region(regionId)
+            if region != previous:
+                self.undoStack.push(MoveRegionCommand(self, regionId, previous, region))
+            return
+
         if event.button() == Qt.MouseButton.RightButton:
-            self.setDragMode(QGraphicsView.DragMode.RubberBandDrag)
+            self.setTool(self.tool)  # Back to the tool's own drag mode.
             modifiedEvent = QMouseEvent(
                 QEvent.Type.MouseButtonRelease,
                 QPointF(event.pos()),
@@ -217,9 +416,24 @@ class ImageView(QGraphicsView):
         return super().mouseReleaseEvent(event)
 
     def mouseMoveEvent(self, event: QMouseEvent):
-        self.positionChangedSignal.emit(self.mapToScene(event.pos()))
+        position = self.mapToScene(event.pos())
+        self.positionChangedSignal.emit(position)
+        if self.moveStart is not None:
+            start, regionId, region = self.moveStart
+            width, height = self.imageItem.pyramid.width, self.imageItem.pyramid.height
+            x = min(max(region.x + round(position.x() - start.x()), 0), width - region.width)
+            y = min(max(region.y + round(position.y() - start.y()), 0), height - region.height)
+            if (x, y) != self.regionModel.region(regionId)[:2]:
+                self.moveRegion(regionId, region._replace(x=x, y=y))
+            return
         return super().mouseMoveEvent(event)
 
+    def keyPressEvent(self, event: QKeyEvent):
+        if event.key() in (Qt.Key.Key_Delete, Qt.Key.Key_Backspace) and self.selectedRegionId is not None:
+            self.undoStack.push(RemoveRegionCommand(self, self.selectedRegionId))
+            return
+        return super().keyPressEvent(event)
+
     def event(self, event: QEvent) -> bool:
         """Override event to prevent the context menu from appearing."""
         if event.type() == QEvent.Type.ContextMenu:
@@ -245,6 +459,7 @@ class ImageViewWrapper(QWidget):
         self.dropHere = DropHere()
         self.dropHere.fileDroppedSignal.connect(self.setImage)
         self.imageView = ImageView()
+        self.imageView.imageChangedSignal.connect(self.showImageView)
         self.imageView.hide()
 
         self.layout().addWidget(self.dropHere)
@@ -258,6 +473,9 @@ class ImageViewWrapper(QWidget):
 
     @pyqtSlot(str)
     def setImage(self, filePath: str):
-        if self.imageView.setImage(filePath):
-            self.dropHere.hide()
-            self.imageView.show()
+        self.imageView.setImage(filePath)
+
+    @pyqtSlot()
+    def showImageView(self):
+        self.dropHere.hide()
+        self.imageView.show()
@@ -1,27 +1,89 @@
+"""Main window and GUI entry point. Modules that pull in cv2 are imported where first needed, to start fast."""
+
+from __future__ import annotations
+
 import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
 
 import icons
+from comparison_runner import ComparisonRunner
+from image_cache import ImageCache
 from image_view import ImageView, ImageViewWrapper
-from image_tools import getIconFromSvg
-from PyQt6.QtCore import QPointF, QSettings, QSize, Qt, QTimer, pyqtSlot
-from PyQt6.QtGui import QAction, QCloseEvent, QColor, QFileSystemModel, QImage, QPalette, QResizeEvent
+from performance_panel import PerformancePanel
+from profiling import profiler
+from PyQt6.QtCore import (
+    QFileSystemWatcher,
+    QItemSelection,
+    QModelIndex,
+    QPointF,
+    QSettings,
+    QSize,
+    QStandardPaths,
+    Qt,
+    QThreadPool,
+    QTimer,
+    pyqtSlot,
+)
+from PyQt6.QtGui import QAction, QActionGroup, QCloseEvent, QColor, QImage, QPalette, QResizeEvent
 from PyQt6.QtWidgets import (
+    QApplication,
     QDockWidget,
+    QFileDialog,
     QLabel,
+    QLineEdit,
     QListView,
     QMainWindow,
     QSlider,
     QToolBar,
     QTreeView,
     QSizePolicy,
+    QVBoxLayout,
     QWidget,
 )
+from qt_image_tools import getIconFromSvg, setIconCacheDirectory
+from result_table_model import ResultTableModel
+from sample_list_model import SampleListModel
+from view_commands import AddRegionsCommand
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+    from engine import SampleResult
+    from region import Region
+    from scheduler import RunStats
+    from watch import DirectoryPoller
 
 
 class MainWindow(QMainWindow):
+    IMAGE_CACHE_BYTES = 1024 * 2**20
+    UNDO_MEMORY_BYTES = 256 * 2**20
+    WATCH_INTERVAL = 1000  # Milliseconds between scans of a watched folder.
+
     def __init__(self):
         super().__init__()
 
+        self.cacheLocation = Path(QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation))
+        setIconCacheDirectory(self.cacheLocation / "icons")
+        self.imageCache = ImageCache(self.IMAGE_CACHE_BYTES)
+        self.samplePaths: list[str] = []
+        self.results: dict[str, SampleResult] = {}
+        self.resultDatabasePath = self.cacheLocation / "results.sqlite"
+        self.comparisonRunner: ComparisonRunner | None = None
+        self.workerPool: ProcessPoolExecutor | None = None  # Started with the first run, kept for later ones.
+        self.comparisonGeneration = 0
+        self.pendingComparisonPaths: list[str] = []
+        self.sessionId: int | None = None
+        self.sessionRegions: list[Region] = []
+        self.pendingSessionRegions: list[Region] = []
+
+        self.directoryPoller: DirectoryPoller | None = None
+        self.fileSystemWatcher = QFileSystemWatcher(self)
+        self.fileSystemWatcher.directoryChanged.connect(self.scanWatchedDirectory)
+        self.watchTimer = QTimer(self)
+        self.watchTimer.setInterval(self.WATCH_INTERVAL)  # Also catches files rewritten in place.
+        self.watchTimer.timeout.connect(self.scanWatchedDirectory)
+
         self.initUI()
         self.initSettings()
 
@@ -33,6 +95,11 @@ class MainWindow(QMainWindow):
             "ImageDiffTool",
         )
         self.settings.clear()  # DEBUG: Remove this line.
+        self.imageCache.setMaxBytes(int(self.settings.value("Cache/imageCacheBytes", self.IMAGE_CACHE_BYTES)))
+        undoMemoryBytes = int(self.settings.value("Edit/undoMemoryBytes", self.UNDO_MEMORY_BYTES))
+        self.referenceView.undoStack.setMaxBytes(undoMemoryBytes)
+        profiling = profiler.enabled or self.settings.value("Debug/profiling", False, type=bool)
+        self.profilingAction.setChecked(profiling)  # Also set when enabled by the environment variable.
         if not self.settings.contains("UI/geometry"):  # First run.
             self.initDefaultSettings()
         else:
@@ -65,6 +132,7 @@ class MainWindow(QMainWindow):
         self.initSamplePreview()
         self.initSamples()
         self.initSelectedRegions()
+        self.initPerformance()
         self.initActions()
         self.initMenuBar()
         self.initToolBar()
@@ -76,12 +144,21 @@ class MainWindow(QMainWindow):
         self.toolBar.setIconSize(QSize(18, 18))
         self.addToolBar(Qt.ToolBarArea.LeftToolBarArea, self.toolBar)
 
-        self.toolBar.addAction(getIconFromSvg(icons.run), "Run", lambda: None)
+        self.toolBar.addAction(getIconFromSvg(icons.run), "Run", self.runComparison)
         self.toolBar.addSeparator()
-        self.toolBar.addAction(getIconFromSvg(icons.pointer), "Pointer", lambda: None)
-        self.toolBar.addAction(getIconFromSvg(icons.marquee), "Select Region", lambda: None)
-        self.toolBar.addAction(getIconFromSvg(icons.move), "Move", lambda: None)
-        self.toolBar.addAction(getIconFromSvg(icons.crop), "Crop to Selection", lambda: None)
+        toolGroup = QActionGroup(self)
+        for icon, text, tool in [
+            (icons.pointer, "Pointer", "pointer"),
+            (icons.marquee, "Select Region", "select"),
+            (icons.move, "Move", "move"),
+        ]:
+            action = self.toolBar.addAction(
+                getIconFromSvg(icon), text, lambda checked=False, tool=tool: self.referenceView.setTool(tool)
+            )
+            action.setCheckable(True)
+            action.setChecked(tool == self.referenceView.tool)
+            toolGroup.addAction(action)
+        self.toolBar.addAction(getIconFromSvg(icons.crop), "Crop to Selection", self.cropToSelection)
         self.toolBar.addSeparator()
         self.toolBar.addAction(getIconFromSvg(icons.zoomIn), "Zoom In", self.referenceView.zoomIn)
         self.toolBar.addAction(getIconFromSvg(icons.zoomOut), "Zoom Out", self.referenceView.zoomOut)
@@ -95,8 +172,10 @@ class MainWindow(QMainWindow):
             "Rotato Counter-Clockwise",
             self.referenceView.rotateCounterClockwise,
         )
-        self.toolBar.addAction(getIconFromSvg(icons.flipHorizontal), "Flip Horizontal", lambda: None)
-        self.toolBar.addAction(getIconFromSvg(icons.flipVertical), "Flip Vertical", lambda: None)
+        self.toolBar.addAction(
+            getIconFromSvg(icons.flipHorizontal), "Flip Horizontal", self.referenceView.flipHorizontal
+        )
+        self.toolBar.addAction(getIconFromSvg(icons.flipVertical), "Flip Vertical", self.referenceView.flipVertical)
 
     # pyright: reportFunctionMemberAccess=false
     def initActions(self):
@@ -108,7 +187,16 @@ class MainWindow(QMainWindow):
         self.openSampleAction = QAction("Open Sample(s)", self)
         self.openSampleAction.setShortcut("Ctrl+R")
         self.openSampleAction.setStatusTip("Open sample image file(s) for comparison")
-        self.openSampleAction.triggered.connect(self.openReference)
+        self.openSampleAction.triggered.connect(self.openSamples)
+
+        self.watchFolderAction = QAction("Watch Folder", self)
+        self.watchFolderAction.setShortcut("Ctrl+Shift+R")
+        self.watchFolderAction.setStatusTip("Compare new and modified images in a folder as they appear")
+        self.watchFolderAction.triggered.connect(self.watchFolder)
+
+        self.loadSessionAction = QAction("Load Last Session", self)
+        self.loadSessionAction.setStatusTip("Show the reference, regions, samples and results of the last comparison")
+        self.loadSessionAction.triggered.connect(self.loadLastSession)
 
         self.quitAction = QAction("Quit", self)
         self.quitAction.setShortcut("Ctrl+Q")
@@ -119,11 +207,31 @@ class MainWindow(QMainWindow):
         self.undoAction.setShortcut("Ctrl+Z")
         self.undoAction.setStatusTip("Undo")
         self.undoAction.setIcon(getIconFromSvg(icons.undo))
+        self.undoAction.triggered.connect(self.referenceView.undoStack.undo)
 
         self.redoAction = QAction("Redo", self)
         self.redoAction.setShortcut("Ctrl+Y")
         self.redoAction.setStatusTip("Redo")
         self.redoAction.setIcon(getIconFromSvg(icons.redo))
+        self.redoAction.triggered.connect(self.referenceView.undoStack.redo)
+        self.referenceView.undoStack.changedSignal.connect(self.updateUndoActions)
+        self.updateUndoActions()
+
+        self.showDifferenceAction = QAction("Show Difference", self)
+        self.showDifferenceAction.setShortcut("Ctrl+D")
+        self.showDifferenceAction.setStatusTip("Overlay the difference of the selected sample on the reference")
+        self.showDifferenceAction.setCheckable(True)
+        self.showDifferenceAction.toggled.connect(self.updateDifference)
+
+        self.detectRegionsAction = QAction("Detect Changed Regions", self)
+        self.detectRegionsAction.setShortcut("Ctrl+Shift+D")
+        self.detectRegionsAction.setStatusTip("Add regions around the areas where the previewed sample differs")
+        self.detectRegionsAction.triggered.connect(self.detectChangedRegions)
+
+        self.profilingAction = QAction("Enable Profiling", self)
+        self.profilingAction.setStatusTip("Time loading, rendering, zooming and comparing in the Performance panel")
+        self.profilingAction.setCheckable(True)
+        self.profilingAction.toggled.connect(self.setProfilingEnabled)
 
     def initMenuBar(self):
         menuBar = self.menuBar()
@@ -131,6 +239,8 @@ class MainWindow(QMainWindow):
         fileMenu = menuBar.addMenu("File")
         fileMenu.addAction(self.openReferenceAction)
         fileMenu.addAction(self.openSampleAction)
+        fileMenu.addAction(self.watchFolderAction)
+        fileMenu.addAction(self.loadSessionAction)
         fileMenu.addSeparator()
         fileMenu.addAction(self.quitAction)
 
@@ -138,36 +248,72 @@ class MainWindow(QMainWindow):
         editMenu.addAction(self.undoAction)
         editMenu.addAction(self.redoAction)
         editMenu.addSeparator()
+        editMenu.addAction(self.detectRegionsAction)
 
         viewMenu = menuBar.addMenu("View")
         zoomMenu = viewMenu.addMenu("Zoom")
         zoomMenu.addAction(getIconFromSvg(icons.zoomIn), "Zoom In", self.referenceView.zoomIn)
         zoomMenu.addAction(getIconFromSvg(icons.zoomOut), "Zoom Out", self.referenceView.zoomOut)
         zoomMenu.addAction(getIconFromSvg(icons.zoomFit), "Zoom Fit", self.referenceView.zoomFit)
+        viewMenu.addAction(self.showDifferenceAction)
 
         panelMenu = viewMenu.addMenu("Panels")
         panelMenu.addAction(self.dockWidgetSamples.toggleViewAction())
         panelMenu.addAction(self.dockWidgetSampleView.toggleViewAction())
         panelMenu.addAction(self.dockWidgetSelectedRegions.toggleViewAction())
+        panelMenu.addAction(self.dockWidgetPerformance.toggleViewAction())
 
         settingsMenu = menuBar.addMenu("Settings")
         settingsMenu.addAction("Restore Default Settings")
+        settingsMenu.addSeparator()
+        settingsMenu.addAction(self.profilingAction)
 
     def initSelectedRegions(self):
         self.dockWidgetSelectedRegions = QDockWidget("Selected Regions")
         self.dockWidgetSelectedRegions.setObjectName("selectedRegionsPanel")
         self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.dockWidgetSelectedRegions)
 
-        treeView = QTreeView()
-        self.dockWidgetSelectedRegions.setWidget(treeView)
+        self.resultTableModel = ResultTableModel(self.resultDatabasePath, self)
+        self.resultFilterEdit = QLineEdit()
+        self.resultFilterEdit.setPlaceholderText("Filter samples")
+        self.resultFilterEdit.setClearButtonEnabled(True)
+        self.resultFilterEdit.textChanged.connect(self.resultTableModel.setFilter)
+
+        self.resultTreeView = QTreeView()
+        self.resultTreeView.setModel(self.resultTableModel)
+        self.resultTreeView.setRootIsDecorated(False)
+        self.resultTreeView.setUniformRowHeights(True)  # Lets the view skip measuring rows it does not show.
+        self.resultTreeView.setSortingEnabled(True)
+        self.resultTreeView.sortByColumn(2, Qt.SortOrder.DescendingOrder)  # Worst regions first.
+        self.resultTreeView.activated.connect(self.showResultSample)
+
+        widget = QWidget()
+        layout = QVBoxLayout(widget)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.resultFilterEdit)
+        layout.addWidget(self.resultTreeView)
+        self.dockWidgetSelectedRegions.setWidget(widget)
+
+    def initPerformance(self):
+        self.dockWidgetPerformance = QDockWidget("Performance")
+        self.dockWidgetPerformance.setObjectName("performancePanel")
+        self.performancePanel = PerformancePanel()
+        self.dockWidgetPerformance.setWidget(self.performancePanel)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self.dockWidgetPerformance)
+        self.dockWidgetPerformance.hide()
 
     def initSamples(self):
         self.dockWidgetSamples = QDockWidget("Samples")
         self.dockWidgetSamples.setObjectName("samplesPanel")
         self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.dockWidgetSamples)
 
-        listView = QListView()
-        self.dockWidgetSamples.setWidget(listView)
+        self.samplesModel = SampleListModel(self.cacheLocation / "thumbnails", self)
+        self.samplesListView = QListView()
+        self.samplesListView.setModel(self.samplesModel)
+        self.samplesListView.setIconSize(QSize(64, 64))
+        self.samplesListView.setUniformItemSizes(True)  # Lets the view skip measuring rows it does not show.
+        self.samplesListView.selectionModel().selectionChanged.connect(self.showSelectedSample)
+        self.dockWidgetSamples.setWidget(self.samplesListView)
 
     def initReferenceView(self):
         self.referenceViewWrapper = ImageViewWrapper()
@@ -178,14 +324,14 @@ class MainWindow(QMainWindow):
     def initSamplePreview(self):
         self.dockWidgetSampleView = QDockWidget("Sample Preview")
         self.dockWidgetSampleView.setObjectName("samplePreviewPanel")
-        self.sampleView = ImageView()
+        self.sampleView = ImageView(self.imageCache)
         self.dockWidgetSampleView.setWidget(self.sampleView)
         self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.dockWidgetSampleView)
 
     def initStatusBar(self):
         self.statusBar().showMessage("Ready")
         toolBar = QToolBar()
-        toolBar.setMaximumWidth(400)
+        toolBar.setMaximumWidth(600)
         self.statusBar().addPermanentWidget(toolBar)
 
         spacer = QWidget()
@@ -200,10 +346,22 @@ class MainWindow(QMainWindow):
 
         self.positionLabel = QLabel()
         self.resolutionLabel = QLabel()
+        self.performanceLabel = QLabel()
+        self.performancePanel.readoutChangedSignal.connect(self.performanceLabel.setText)
 
+        toolBar.addWidget(self.performanceLabel)
         addWidgetWithSpacing(self.positionLabel)
         addWidgetWithSpacing(self.resolutionLabel)
 
+        self.heatmapOpacitySlider = QSlider(Qt.Orientation.Horizontal)
+        self.heatmapOpacitySlider.setRange(0, 100)
+        self.heatmapOpacitySlider.setValue(50)
+        self.heatmapOpacitySlider.setMaximumWidth(100)
+        self.heatmapOpacitySlider.setToolTip("Difference opacity")
+        self.heatmapOpacitySlider.setEnabled(False)
+        self.heatmapOpacitySlider.valueChanged.connect(self.referenceView.setHeatmapOpacity)
+        addWidgetWithSpacing(self.heatmapOpacitySlider)
+
         self.zoomSlider = QSlider(Qt.Orientation.Horizontal)
         self.zoomSlider.setPageStep(1)
         self.zoomSlider.setSingleStep(1)
@@ -219,6 +377,10 @@ class MainWindow(QMainWindow):
         self.zoomSlider.valueChanged.connect(lambda: zoomLabel.setText(f"{self.zoomSlider.value()*100}%"))
         self.referenceView.positionChangedSignal.connect(self.updatePositionLabel)
         self.referenceView.imageChangedSignal.connect(self.updateResolutionLabel)
+        self.referenceView.imageChangedSignal.connect(self.restoreSessionRegions)
+        self.referenceView.imageChangedSignal.connect(self.updateDifference)
+        self.sampleView.imageChangedSignal.connect(self.updateDifference)
+        self.referenceView.orientationChangedSignal.connect(self.updateDifference)
 
     def updatePositionLabel(self, position: QPointF):
         x = position.toPoint().x()
@@ -230,7 +392,263 @@ class MainWindow(QMainWindow):
 
     @pyqtSlot()
     def openReference(self):
-        pass
+        filePath, _ = QFileDialog.getOpenFileName(self, "Open Reference")
+        if filePath:
+            self.referenceViewWrapper.setImage(filePath)
+
+    @pyqtSlot()
+    def openSamples(self):
+        filePaths, _ = QFileDialog.getOpenFileNames(self, "Open Sample(s)")
+        if filePaths:
+            self.stopWatching()
+            self.cancelComparison()
+            self.samplePaths = filePaths
+            self.samplesModel.setSamplePaths(filePaths)
+            self.statusBar().showMessage(f"{len(filePaths)} sample(s) loaded")
+
+    @pyqtSlot()
+    def watchFolder(self):
+        directory = QFileDialog.getExistingDirectory(self, "Watch Folder")
+        if not directory:
+            return
+        from watch import DirectoryPoller
+
+        self.stopWatching()
+        self.cancelComparison()
+        self.samplePaths = []
+        self.samplesModel.setSamplePaths([])
+        self.directoryPoller = DirectoryPoller(directory)
+        self.directoryPoller.scan()  # Files are reported once they are unchanged on the next scan.
+        self.fileSystemWatcher.addPath(directory)
+        self.watchTimer.start()
+        self.statusBar().showMessage(f"Watching {directory}")
+
+    def stopWatching(self):
+        if self.directoryPoller is None:
+            return
+        self.watchTimer.stop()
+        self.fileSystemWatcher.removePath(self.directoryPoller.directory)
+        self.directoryPoller = None
+
+    @pyqtSlot()
+    def scanWatchedDirectory(self):
+        if self.directoryPoller is None:
+            return
+        changed = self.directoryPoller.scan()
+        if not changed:
+            return
+        added = [samplePath for samplePath in changed if samplePath not in self.samplesModel.rows]
+        for samplePath in changed:
+            self.samplesModel.invalidateThumbnail(samplePath)
+        if added:
+            self.samplePaths.extend(added)
+            self.samplesModel.addSamplePaths(added)
+            self.statusBar().showMessage(f"{len(added)} new sample(s) in {self.directoryPoller.directory}")
+        if not self.referenceView.imageItem.isNull() and self.referenceView.regions:
+            self.compareSamples(changed)
+
+    @pyqtSlot()
+    def updateDifference(self):
+        """Overlay the difference of the previewed sample on the reference while Show Difference is checked."""
+        showDifference = self.showDifferenceAction.isChecked()
+        self.heatmapOpacitySlider.setEnabled(showDifference)
+        samplePyramid = self.sampleView.imageItem.pyramid if showDifference else None
+        if not self.referenceView.setDifferencePyramid(samplePyramid):
+            self.statusBar().showMessage("The sample size does not match the reference size")
+
+    @pyqtSlot()
+    def detectChangedRegions(self):
+        """Add a region around each area where the previewed sample differs from the reference."""
+        referencePyramid = self.referenceView.sourcePyramid  # Uncropped, like the sample.
+        # Turned back to the loaded image's orientation, so the regions found are in its coordinates.
+        samplePyramid = self.referenceView.storedFramePyramid(self.sampleView.imageItem.pyramid)
+        if referencePyramid is None or samplePyramid is None:
+            self.statusBar().showMessage("Open a reference and preview a sample first")
+            return
+        from autodetect import detectChangedRegions
+
+        try:
+            regions = detectChangedRegions(referencePyramid, samplePyramid)
+        except ValueError as error:
+            self.statusBar().showMessage(str(error))
+            return
+        regions = self.referenceView.croppedRegions(regions)
+        if regions:
+            command = AddRegionsCommand(self.referenceView, "Detect Changed Regions", regions)
+            self.referenceView.undoStack.push(command)
+        self.statusBar().showMessage(f"Detected {len(regions)} changed region(s)")
+
+    @pyqtSlot()
+    def updateUndoActions(self):
+        undoStack = self.referenceView.undoStack
+        self.undoAction.setEnabled(undoStack.canUndo())
+        self.undoAction.setText(f"Undo {undoStack.undoText()}".rstrip())
+        self.redoAction.setEnabled(undoStack.canRedo())
+        self.redoAction.setText(f"Redo {undoStack.redoText()}".rstrip())
+
+    @pyqtSlot()
+    def cropToSelection(self):
+        if not self.referenceView.cropToSelection():
+            self.statusBar().showMessage("Select a region to crop to first")
+
+    @pyqtSlot(bool)
+    def setProfilingEnabled(self, enabled: bool):
+        self.performancePanel.setProfilingEnabled(enabled)
+        self.settings.setValue("Debug/profiling", enabled)
+        if enabled:
+            self.dockWidgetPerformance.show()
+
+    @pyqtSlot()
+    def loadLastSession(self):
+        from results_db import ResultDatabase
+
+        database = ResultDatabase(self.resultDatabasePath)
+        try:
+            session = database.latestSession()
+            results = database.sessionResults(session.id) if session is not None else []
+        finally:
+            database.close()
+        if session is None:
+            self.statusBar().showMessage("No previous session")
+            return
+
+        self.stopWatching()
+        self.cancelComparison()
+        self.sessionId = session.id
+        self.sessionRegions = session.regions
+        self.pendingSessionRegions = session.regions  # Added once the reference is shown.
+        self.referenceView.setOrientation(session.orientation)
+        self.referenceViewWrapper.setImage(session.reference)
+        self.samplePaths = session.samplePaths
+        self.samplesModel.setSamplePaths(session.samplePaths)
+        self.results = {result.filePath: result for result in results}
+        for result in results:
+            self.samplesModel.setResult(result)
+        self.resultTableModel.setSession(session.id)
+        self.statusBar().showMessage(f"Loaded {len(results)}/{len(session.samplePaths)} compared sample(s)")
+
+    @pyqtSlot()
+    def restoreSessionRegions(self):
+        if not self.pendingSessionRegions:
+            return
+        # Session regions are in the displayed orientation; the view keeps them in the stored image's coordinates.
+        height, width = self.referenceView.sourcePyramid.levels[0].shape[:2]
+        displayedSize = self.referenceView.orientation.displayedSize(width, height)
+        inverse = self.referenceView.orientation.inverted()
+        for region in self.pendingSessionRegions:
+            self.referenceView.addRegion(inverse.mapRegion(region, *displayedSize))
+        self.pendingSessionRegions = []
+
+    @pyqtSlot(QModelIndex)
+    def showResultSample(self, index: QModelIndex):
+        row = self.samplesModel.rows.get(self.resultTableModel.samplePath(index.row()))
+        if row is not None:
+            self.samplesListView.setCurrentIndex(self.samplesModel.index(row))
+
+    @pyqtSlot(QItemSelection, QItemSelection)
+    def showSelectedSample(self, selected: QItemSelection, deselected: QItemSelection):
+        if selected.isEmpty():
+            return
+        row = selected.indexes()[0].row()
+        self.sampleView.setImage(self.samplePaths[row])
+        self.imageCache.prefetch(
+            self.samplePaths[neighbour] for neighbour in (row - 1, row + 1) if 0 <= neighbour < len(self.samplePaths)
+        )
+
+    @pyqtSlot()
+    def runComparison(self):
+        if self.referenceView.imageItem.isNull():
+            self.statusBar().showMessage("Open a reference image first")
+            return
+        if not self.referenceView.regions:
+            self.statusBar().showMessage("Select at least one region on the reference image")
+            return
+        if not self.samplePaths:
+            self.statusBar().showMessage("Open at least one sample image")
+            return
+
+        self.cancelComparison()
+        self.results = {}
+        self.samplesModel.clearResults()
+        self.sessionId = None  # Each run is a new session.
+        self.compareSamples(self.samplePaths)
+
+    def compareSamples(self, samplePaths: list[str]):
+        """Compare samples in the background, after the comparison already running if there is one."""
+        if self.comparisonRunner is not None:
+            self.pendingComparisonPaths.extend(samplePaths)
+            return
+        regions = self.referenceView.orientedRegions()  # Uncropped, like the samples, and oriented as shown.
+        if self.workerPool is None:
+            from scheduler import createWorkerPool
+
+            self.workerPool = createWorkerPool()
+        if regions != self.sessionRegions:
+            self.sessionId = None
+        self.comparisonRunner = ComparisonRunner(
+            self.comparisonGeneration,
+            self.referenceView.orientedImage(),
+            regions,
+            samplePaths,
+            self.resultDatabasePath,
+            self.referenceView.filePath,
+            self.sessionId,
+            self.referenceView.orientation,
+            self.workerPool,
+        )
+        self.comparisonRunner.signals.sessionSignal.connect(self.onComparisonSession)
+        self.comparisonRunner.signals.resultSignal.connect(self.onComparisonResult)
+        self.comparisonRunner.signals.finishedSignal.connect(self.onComparisonFinished)
+        self.comparisonRunner.signals.failedSignal.connect(self.onComparisonFailed)
+        QThreadPool.globalInstance().start(self.comparisonRunner)
+        self.statusBar().showMessage(f"Comparing {len(samplePaths)} sample(s)...")
+
+    def cancelComparison(self):
+        if self.comparisonRunner is not None:
+            self.comparisonRunner.cancel()
+            self.comparisonRunner = None
+        self.pendingComparisonPaths.clear()
+        self.comparisonGeneration += 1
+
+    def startPendingComparison(self):
+        self.comparisonRunner = None
+        if self.pendingComparisonPaths:
+            samplePaths = list(dict.fromkeys(self.pendingComparisonPaths))
+            self.pendingComparisonPaths.clear()
+            self.compareSamples(samplePaths)
+
+    @pyqtSlot(int, int)
+    def onComparisonSession(self, generation: int, sessionId: int):
+        if generation != self.comparisonGeneration:
+            return
+        self.sessionId = sessionId
+        self.sessionRegions = list(self.comparisonRunner.regions)
+        self.resultTableModel.setSession(sessionId)
+
+    @pyqtSlot(int, object)
+    def onComparisonResult(self, generation: int, result: SampleResult):
+        if generation != self.comparisonGeneration:
+            return
+        self.results[result.filePath] = result
+        self.samplesModel.setResult(result)
+        self.statusBar().showMessage(f"Compared {len(self.results)}/{len(self.samplePaths)} sample(s)")
+
+    @pyqtSlot(int, object)
+    def onComparisonFinished(self, generation: int, stats: RunStats):
+        if generation != self.comparisonGeneration:
+            return
+        failed = sum(result.scores is None for result in self.results.values())
+        self.statusBar().showMessage(f"Compared {stats}, {failed} failed")
+        self.resultTableModel.refresh()
+        self.startPendingComparison()
+
+    @pyqtSlot(int, str)
+    def onComparisonFailed(self, generation: int, error: str):
+        if generation != self.comparisonGeneration:
+            return
+        self.statusBar().showMessage(f"Comparison failed: {error}")
+        self.shutDownWorkerPool()  # It may be broken by a crashed worker; the next run starts a new one.
+        self.startPendingComparison()
 
     def resizeEvent(self, a0: QResizeEvent):
         if self.referenceView.currentZoom == self.referenceView.MINIMUM_ZOOM:
@@ -240,12 +658,19 @@ class MainWindow(QMainWindow):
     def closeEvent(self, a0: QCloseEvent):
         self.settings.setValue("UI/geometry", self.saveGeometry())
         self.settings.setValue("UI/windowState", self.saveState())
+        self.resultTableModel.close()
+        self.cancelComparison()
+        self.shutDownWorkerPool()
         super().closeEvent(a0)
 
+    def shutDownWorkerPool(self):
+        if self.workerPool is not None:
+            self.workerPool.shutdown(wait=False, cancel_futures=True)
+            self.workerPool = None
 
-if __name__ == "__main__":
-    from PyQt6.QtWidgets import QApplication
 
+def createApplication() -> QApplication:
+    """Create the application, in the Fusion style with a dark palette."""
     app = QApplication(sys.argv)
     app.setStyle("Fusion")
     darkPalette = QPalette()
@@ -268,7 +693,12 @@ if __name__ == "__main__":
     darkPalette.setColor(QPalette.ColorGroup.Disabled, QPalette.ColorRole.Text, Qt.GlobalColor.darkGray)
     darkPalette.setColor(QPalette.ColorGroup.Disabled, QPalette.ColorRole.Light, QColor(53, 53, 53))
     app.setPalette(darkPalette)
+    return app
+
+
+if __name__ == "__main__":
+    app = createApplication()
     window = MainWindow()
-    window.referenceViewWrapper.setImage("example.jpg")
     window.show()
+    QTimer.singleShot(0, lambda: window.referenceViewWrapper.setImage("example.jpg"))  # Once the window is up.
     app.exec()
@@ -0,0 +1,171 @@
+"""Per-region similarity metrics."""
+
+import math
+
+import cv2
+import numpy as np
+
+SSIM_WINDOW_SIZE = 11
+SSIM_SIGMA = 1.5
+MS_SSIM_WEIGHTS = (0.0448, 0.2856, 0.3001, 0.2363, 0.1333)
+
+
+def meanAbsoluteDifference(first: cv2.Mat, second: cv2.Mat) -> float:
+    return float(np.mean(cv2.mean(cv2.absdiff(first, second))[: _channels(first)]))
+
+
+def psnr(first: cv2.Mat, second: cv2.Mat, maxValue: float = 255.0) -> float:
+    """Peak signal-to-noise ratio in dB; infinite for identical inputs."""
+    meanSquaredError = cv2.norm(first, second, cv2.NORM_L2SQR) / first.size
+    if meanSquaredError == 0:
+        return math.inf
+    return 10 * math.log10(maxValue**2 / meanSquaredError)
+
+
+def ssim(first: cv2.Mat, second: cv2.Mat, maxValue: float = 255.0, gaussian: bool = True) -> float:
+    """Mean structural similarity, averaged over channels.
+
+    Uses an 11x11 Gaussian window (sigma 1.5) applied as two 1D passes, or with
+    `gaussian=False` an 11x11 box window, whose cost does not depend on its size."""
+    similarity, _ = _ssimComponents(first.astype(np.float32), second.astype(np.float32), maxValue, gaussian)
+    return float(similarity.mean())
+
+
+def msssim(first: cv2.Mat, second: cv2.Mat, maxValue: float = 255.0) -> float:
+    """Multi-scale structural similarity over up to five scales.
+
+    Scales that would leave fewer pixels than one SSIM window are dropped and the
+    remaining weights renormalized, so small regions still get a score."""
+    scales = 1
+    while scales < len(MS_SSIM_WEIGHTS) and min(first.shape[:2]) >> scales >= SSIM_WINDOW_SIZE:
+        scales += 1
+    weights = np.array(MS_SSIM_WEIGHTS[:scales], dtype=np.float64)
+    weights /= weights.sum()
+
+    first, second = first.astype(np.float32), second.astype(np.float32)
+    score = 1.0
+    for scale, weight in enumerate(weights):
+        similarity, contrastStructure = _ssimComponents(first, second, maxValue, gaussian=True)
+        value = similarity.mean() if scale == scales - 1 else contrastStructure.mean()
+        score *= max(float(value), 0.0) ** weight
+        if scale < scales - 1:
+            size = (first.shape[1] // 2, first.shape[0] // 2)
+            first = cv2.resize(first, size, interpolation=cv2.INTER_AREA)
+            second = cv2.resize(second, size, interpolation=cv2.INTER_AREA)
+    return score
+
+
+class SummedAreaTable:
+    """Summed-area tables of an image and, optionally, of its square.
+
+    Built in one pass over the image; afterwards the sum, mean or variance of any
+    rectangle takes four lookups per channel, however large the rectangle is.
+    Rectangles are given as an (n, 4) array of x, y, width, height rows and all
+    results are (n, channels) arrays."""
+
+    def __init__(self, image: cv2.Mat, squared: bool = True):
+        self.channels = _channels(image)
+        if squared:
+            self.sums, self.squaredSums = cv2.integral2(image, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+        else:
+            self.sums, self.squaredSums = cv2.integral(image, sdepth=cv2.CV_64F), None
+
+    @staticmethod
+    def rectangleSums(table: np.ndarray, rectangles: np.ndarray) -> np.ndarray:
+        x0, y0 = rectangles[:, 0], rectangles[:, 1]
+        x1, y1 = x0 + rectangles[:, 2], y0 + rectangles[:, 3]
+        sums = table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+        return sums.reshape(len(rectangles), -1)
+
+    def areas(self, rectangles: np.ndarray) -> np.ndarray:
+        return (rectangles[:, 2] * rectangles[:, 3])[:, np.newaxis]
+
+    def sum(self, rectangles: np.ndarray) -> np.ndarray:
+        return self.rectangleSums(self.sums, rectangles)
+
+    def squaredSum(self, rectangles: np.ndarray) -> np.ndarray:
+        if self.squaredSums is None:
+            raise ValueError("Summed-area table was built without squares.")
+        return self.rectangleSums(self.squaredSums, rectangles)
+
+    def mean(self, rectangles: np.ndarray) -> np.ndarray:
+        return self.sum(rectangles) / self.areas(rectangles)
+
+    def variance(self, rectangles: np.ndarray) -> np.ndarray:
+        areas = self.areas(rectangles)
+        mean = self.sum(rectangles) / areas
+        return np.maximum(self.squaredSum(rectangles) / areas - mean * mean, 0.0)  # Clamp rounding below zero.
+
+
+def differenceTable(first: cv2.Mat, second: cv2.Mat, squared: bool = True) -> SummedAreaTable:
+    """Summed-area table of the absolute difference of two images.
+
+    Its rectangle means are the mean absolute difference of each rectangle and its
+    squared sums the difference energy, i.e. the sum of squared differences."""
+    return SummedAreaTable(cv2.absdiff(first, second), squared)
+
+
+METRICS = {
+    "mad": meanAbsoluteDifference,
+    "psnr": psnr,
+    "ssim": ssim,
+    "msssim": msssim,
+}
+
+
+def _channels(image: cv2.Mat) -> int:
+    return 1 if image.ndim == 2 else image.shape[2]
+
+
+def _ssimComponents(
+    first: np.ndarray, second: np.ndarray, maxValue: float, gaussian: bool
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return the SSIM map and its contrast-structure term for float32 inputs."""
+    c1 = (0.01 * maxValue) ** 2
+    c2 = (0.03 * maxValue) ** 2
+
+    if gaussian:
+        kernel = cv2.getGaussianKernel(SSIM_WINDOW_SIZE, SSIM_SIGMA, cv2.CV_32F)
+
+        def localMean(image: np.ndarray) -> np.ndarray:
+            return cv2.sepFilter2D(image, cv2.CV_32F, kernel, kernel, borderType=cv2.BORDER_REFLECT)
+
+    else:
+
+        def localMean(image: np.ndarray) -> np.ndarray:
+            return cv2.boxFilter(image, cv2.CV_32F, (SSIM_WINDOW_SIZE, SSIM_WINDOW_SIZE), borderType=cv2.BORDER_REFLECT)
+
+    # Every intermediate is a full-size float32 image, so products and sums are taken in place.
+    meanFirst = localMean(first)
+    meanSecond = localMean(second)
+    product = np.multiply(first, first)
+    varianceFirst = localMean(product)
+    np.multiply(second, second, out=product)
+    varianceSecond = localMean(product)
+    np.multiply(first, second, out=product)
+    covariance = localMean(product)
+
+    meanProduct = np.multiply(meanFirst, meanSecond, out=product)
+    meanFirstSquared = np.multiply(meanFirst, meanFirst, out=meanFirst)
+    meanSecondSquared = np.multiply(meanSecond, meanSecond, out=meanSecond)
+    varianceFirst -= meanFirstSquared
+    varianceSecond -= meanSecondSquared
+    covariance -= meanProduct
+
+    # contrastStructure = (2 * covariance + c2) / (varianceFirst + varianceSecond + c2)
+    contrastStructure = covariance
+    contrastStructure *= 2
+    contrastStructure += c2
+    varianceFirst += varianceSecond
+    varianceFirst += c2
+    contrastStructure /= varianceFirst
+
+    # similarity = (2 * meanProduct + c1) / (meanFirstSquared + meanSecondSquared + c1) * contrastStructure
+    similarity = meanProduct
+    similarity *= 2
+    similarity += c1
+    meanFirstSquared += meanSecondSquared
+    meanFirstSquared += c1
+    similarity /= meanFirstSquared
+    similarity *= contrastStructure
+    return similarity, contrastStructure
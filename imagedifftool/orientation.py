@@ -0,0 +1,53 @@
+"""Rotation and mirroring of an image as a transform rather than as rotated pixels."""
+
+from typing import NamedTuple
+
+import numpy as np
+from region import Region
+
+
+class Orientation(NamedTuple):
+    """The stored image mirrored left to right if `mirrored`, then turned clockwise `quarterTurns` times."""
+
+    quarterTurns: int = 0
+    mirrored: bool = False
+
+    def isIdentity(self) -> bool:
+        return self.quarterTurns == 0 and not self.mirrored
+
+    def rotatedClockwise(self) -> "Orientation":
+        return Orientation((self.quarterTurns + 1) % 4, self.mirrored)
+
+    def rotatedCounterClockwise(self) -> "Orientation":
+        return Orientation((self.quarterTurns - 1) % 4, self.mirrored)
+
+    def flippedHorizontally(self) -> "Orientation":
+        # Mirroring what is displayed undoes the turns: F R^k = R^-k F.
+        return Orientation(-self.quarterTurns % 4, not self.mirrored)
+
+    def flippedVertically(self) -> "Orientation":
+        # A vertical flip is a horizontal one turned half way round.
+        return Orientation((2 - self.quarterTurns) % 4, not self.mirrored)
+
+    def inverted(self) -> "Orientation":
+        # A mirrored orientation is its own inverse: (R^k F)^-1 = F R^-k = R^k F.
+        return self if self.mirrored else Orientation(-self.quarterTurns % 4, False)
+
+    def apply(self, openCVImage: np.ndarray) -> np.ndarray:
+        """Return the image as displayed, as a view sharing the stored pixels."""
+        if self.mirrored:
+            openCVImage = openCVImage[:, ::-1]
+        return np.rot90(openCVImage, -self.quarterTurns)
+
+    def displayedSize(self, width: int, height: int) -> tuple[int, int]:
+        return (height, width) if self.quarterTurns % 2 else (width, height)
+
+    def mapRegion(self, region: Region, width: int, height: int) -> Region:
+        """Map a region of a stored image of the given size to displayed coordinates."""
+        x0, y0, x1, y1 = region.x, region.y, region.x + region.width, region.y + region.height
+        if self.mirrored:
+            x0, x1 = width - x1, width - x0
+        for _ in range(self.quarterTurns):  # A clockwise turn maps (x, y) to (height - y, x).
+            x0, y0, x1, y1 = height - y1, x0, height - y0, x1
+            width, height = height, width
+        return Region(x0, y0, x1 - x0, y1 - y0)
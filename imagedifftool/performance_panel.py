@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from PyQt6.QtCore import QTimer, pyqtSignal, pyqtSlot
+from PyQt6.QtWidgets import (
+    QFileDialog,
+    QHBoxLayout,
+    QMessageBox,
+    QPushButton,
+    QTreeWidget,
+    QTreeWidgetItem,
+    QVBoxLayout,
+    QWidget,
+)
+from profiling import profiler
+
+
+class PerformancePanel(QWidget):
+    """Per-operation timings of the profiler, refreshed while the panel is shown and profiling is on."""
+
+    REFRESH_INTERVAL = 1000  # Milliseconds.
+    COLUMNS = ("Operation", "Count", "Total ms", "Mean ms", "Max ms")
+    readoutChangedSignal = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+
+        self.initUI()
+        self.refreshTimer = QTimer(self)
+        self.refreshTimer.setInterval(self.REFRESH_INTERVAL)
+        self.refreshTimer.timeout.connect(self.refresh)
+
+    def initUI(self):
+        self.treeWidget = QTreeWidget()
+        self.treeWidget.setHeaderLabels(self.COLUMNS)
+        self.treeWidget.setRootIsDecorated(False)
+        self.treeWidget.setUniformRowHeights(True)
+
+        clearButton = QPushButton("Clear")
+        clearButton.clicked.connect(self.clear)
+        exportButton = QPushButton("Export Trace...")
+        exportButton.clicked.connect(self.exportTrace)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        buttons.addWidget(clearButton)
+        buttons.addWidget(exportButton)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.treeWidget)
+        layout.addLayout(buttons)
+
+    def setProfilingEnabled(self, enabled: bool):
+        profiler.setEnabled(enabled)
+        if enabled:
+            self.refreshTimer.start()
+        else:
+            self.refreshTimer.stop()
+            self.readoutChangedSignal.emit("")
+        self.refresh()
+
+    @pyqtSlot()
+    def refresh(self):
+        self.readoutChangedSignal.emit(self.readout())
+        if not self.isVisible():
+            return
+        self.treeWidget.clear()
+        for summary in profiler.summary():
+            item = QTreeWidgetItem(
+                [
+                    summary.name,
+                    str(summary.count),
+                    f"{summary.totalSeconds * 1000:.1f}",
+                    f"{summary.meanSeconds * 1000:.2f}",
+                    f"{summary.maxSeconds * 1000:.2f}",
+                ]
+            )
+            self.treeWidget.addTopLevelItem(item)
+
+    @staticmethod
+    def readout() -> str:
+        """The latest load, render and compare times, for the status bar."""
+        if not profiler.enabled:
+            return ""
+        parts = [
+            f"{name} {profiler.latest[name].duration / 1e6:.0f} ms"
+            for name in ("load", "render", "compare")
+            if name in profiler.latest
+        ]
+        return ", ".join(parts)
+
+    @pyqtSlot()
+    def clear(self):
+        profiler.clear()
+        self.refresh()
+
+    @pyqtSlot()
+    def exportTrace(self):
+        filePath, _ = QFileDialog.getSaveFileName(self, "Export Trace", "trace.json", "Chrome trace (*.json)")
+        if not filePath:
+            return
+        try:
+            profiler.exportChromeTrace(filePath)
+        except OSError as error:
+            QMessageBox.critical(self, "Error", f"Could not export trace: {error}")
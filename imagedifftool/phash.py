@@ -0,0 +1,114 @@
+"""Perceptual hashes of samples, to skip samples identical to the reference and compare near-duplicates once."""
+
+from typing import Generic, Iterable, NamedTuple, TypeVar
+
+import cv2
+import numpy as np
+from thumbnails import makeThumbnail
+
+REDUCED_SIZE = 64  # Pixels on the longer side of the reduced decode the hashes are computed from.
+
+Item = TypeVar("Item")
+
+
+class ImageHashes(NamedTuple):
+    average: int
+    difference: int
+    perceptual: int
+
+    def distance(self, other: "ImageHashes") -> int:
+        """The Hamming distance of the perceptual hashes, the most robust of the three."""
+        return hammingDistance(self.perceptual, other.perceptual)
+
+
+def hammingDistance(first: int, second: int) -> int:
+    return (first ^ second).bit_count()
+
+
+def _packBits(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def hashImage(openCVImage: cv2.Mat) -> ImageHashes:
+    if openCVImage.ndim == 3:
+        openCVImage = cv2.cvtColor(
+            openCVImage, cv2.COLOR_BGR2GRAY if openCVImage.shape[2] == 3 else cv2.COLOR_BGRA2GRAY
+        )
+    gray = openCVImage.astype(np.float32)
+
+    average = cv2.resize(gray, (8, 8), interpolation=cv2.INTER_AREA)
+    difference = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    frequencies = cv2.dct(cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA))[:8, :8]
+    median = np.median(frequencies.ravel()[1:])  # Without the DC term, which only carries the brightness.
+    return ImageHashes(
+        _packBits(average > average.mean()),
+        _packBits(difference[:, 1:] > difference[:, :-1]),
+        _packBits(frequencies > median),
+    )
+
+
+def hashFile(filePath: str) -> ImageHashes | None:
+    """Hash an image file from a reduced decode; None if it cannot be read."""
+    thumbnail = makeThumbnail(filePath, REDUCED_SIZE)
+    if thumbnail is None:
+        return None
+    return hashImage(thumbnail)
+
+
+class HashIndex(Generic[Item]):
+    """Multi-index hash table of 64 bit hashes, finding those within `maxDistance` bits of a query.
+
+    Each hash is split into `maxDistance + 1` chunks, with a table per chunk.
+    Two hashes at most `maxDistance` bits apart cannot differ in every chunk, so
+    the hashes agreeing with the query on one chunk are the only candidates: a
+    search looks up one bucket per table instead of comparing every hash."""
+
+    def __init__(self, maxDistance: int, bits: int = 64):
+        self.maxDistance = maxDistance
+        chunkCount = min(maxDistance + 1, bits)
+        bounds = [bits * i // chunkCount for i in range(chunkCount + 1)]
+        self.chunks = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]  # Shift, mask.
+        self.tables: list[dict[int, list[int]]] = [{} for _ in self.chunks]
+        self.items: dict[int, list[Item]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self.items.values())
+
+    def add(self, imageHash: int, item: Item):
+        items = self.items.get(imageHash)
+        if items is not None:
+            items.append(item)
+            return
+        self.items[imageHash] = [item]
+        for table, (shift, mask) in zip(self.tables, self.chunks):
+            table.setdefault(imageHash >> shift & mask, []).append(imageHash)
+
+    def search(self, imageHash: int) -> list[tuple[int, Item]]:
+        """Return the items whose hash is within `maxDistance` of `imageHash`, with their distance, nearest first."""
+        candidates: set[int] = set()
+        for table, (shift, mask) in zip(self.tables, self.chunks):
+            candidates.update(table.get(imageHash >> shift & mask, ()))
+        found = []
+        for candidate in candidates:
+            distance = hammingDistance(imageHash, candidate)
+            if distance <= self.maxDistance:
+                found.extend((distance, item) for item in self.items[candidate])
+        found.sort(key=lambda entry: entry[0])
+        return found
+
+
+def groupNearDuplicates(hashes: Iterable[tuple[str, ImageHashes]], maxDistance: int) -> dict[str, list[str]]:
+    """Group files whose perceptual hashes are within `maxDistance` of the first file of their group.
+
+    Returns the members of each group by the group's first file, in input order;
+    a file that is nobody's near-duplicate is a group of its own."""
+    groups: dict[str, list[str]] = {}
+    representatives: HashIndex[str] = HashIndex(maxDistance)
+    for filePath, imageHashes in hashes:
+        nearest = representatives.search(imageHashes.perceptual)
+        if nearest:
+            groups[nearest[0][1]].append(filePath)
+        else:
+            representatives.add(imageHashes.perceptual, filePath)
+            groups[filePath] = []
+    return groups
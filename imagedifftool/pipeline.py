@@ -0,0 +1,430 @@
+"""Streaming comparison pipeline: discover, decode, align, diff and emit, each stage on its own thread."""
+
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+import cv2
+import numpy as np
+from alignment import Aligner, warpRegion
+from engine import RegionIndex, SampleResult, loadSampleCrop, scoreBatch, scoreRegions
+from image_cache import ImageCache
+from image_tools import getOpenCVImage
+from phash import ImageHashes, groupNearDuplicates, hashFile
+from profiling import span
+from region import Region
+from results_db import ResultDatabase, imageFingerprint, regionKeys
+from scheduler import RunStats, iterCompareSamplesParallel, peakRSS
+
+IMAGE_SUFFIXES = {".bmp", ".jpeg", ".jpg", ".npy", ".pgm", ".png", ".pnm", ".ppm", ".tif", ".tiff", ".webp"}
+DEFAULT_QUEUE_DEPTH = 4
+
+
+class SampleItem(NamedTuple):
+    filePath: str
+    image: cv2.Mat | None = None  # The decoded sample, or only its regions' bounding box.
+    error: str | None = None
+    transform: np.ndarray | None = None
+    alignmentSeconds: float = 0.0
+
+
+Stage = Callable[[Iterator], Iterator]
+
+
+def findSamples(paths: Iterable[str]) -> Iterator[str]:
+    """Expand directories into the image files directly inside them, in name order."""
+    for path in map(Path, paths):
+        if path.is_dir():
+            yield from (str(child) for child in sorted(path.iterdir()) if child.suffix.lower() in IMAGE_SUFFIXES)
+        else:
+            yield str(path)
+
+
+def discover(paths: Iterable[str]) -> Iterator[SampleItem]:
+    return (SampleItem(filePath) for filePath in findSamples(paths))
+
+
+def decodeRegions(reference: cv2.Mat, index: RegionIndex) -> Stage:
+    """Decode only the regions' bounding box of each sample, memory-mapping it where the format allows."""
+
+    def stage(items: Iterator[SampleItem]) -> Iterator[SampleItem]:
+        for item in items:
+            with span("decode"):
+                crop = loadSampleCrop(item.filePath, reference, index)
+            yield item._replace(error=crop) if isinstance(crop, str) else item._replace(image=crop)
+
+    return stage
+
+
+def decodeFull(reference: cv2.Mat, imageCache: ImageCache | None = None) -> Stage:
+    """Decode whole samples, as alignment needs them, through `imageCache` if given."""
+
+    def stage(items: Iterator[SampleItem]) -> Iterator[SampleItem]:
+        for item in items:
+            with span("decode"):
+                if imageCache is not None:
+                    pyramid = imageCache.getPyramid(item.filePath)
+                    image = pyramid.levels[0] if pyramid is not None else None
+                else:
+                    image = getOpenCVImage(item.filePath)
+            if image is None:
+                yield item._replace(error="Could not load image.")
+            elif image.shape != reference.shape or image.dtype != reference.dtype:
+                yield item._replace(error=f"Image size {image.shape} does not match reference size {reference.shape}.")
+            else:
+                yield item._replace(image=image)
+
+    return stage
+
+
+def cropRegions(index: RegionIndex) -> Stage:
+    """Reduce whole decoded samples to the regions' bounding box."""
+
+    def stage(items: Iterator[SampleItem]) -> Iterator[SampleItem]:
+        for item in items:
+            yield item if item.error is not None else item._replace(image=index.crop(item.image))
+
+    return stage
+
+
+def align(index: RegionIndex, aligner: Aligner) -> Stage:
+    """Align whole samples and reduce them to the regions' bounding box, reusing cached transforms."""
+
+    def stage(items: Iterator[SampleItem]) -> Iterator[SampleItem]:
+        try:
+            for item in items:
+                if item.error is not None:
+                    yield item
+                    continue
+                transform = aligner.cachedTransform(item.filePath)
+                seconds = 0.0
+                if transform is None:
+                    start = time.perf_counter()
+                    with span("align"):
+                        transform = aligner.estimate(item.image)
+                    seconds = time.perf_counter() - start
+                    aligner.rememberTransform(item.filePath, transform)
+                crop = warpRegion(item.image, transform, index.boundingBox)
+                yield item._replace(image=crop, transform=transform, alignmentSeconds=seconds)
+        finally:
+            aligner.saveCache()
+
+    return stage
+
+
+def diff(reference: cv2.Mat, index: RegionIndex, metric: str = "mad") -> Stage:
+    """Score the bounding box crop of each sample, one sample at a time so results are not held back."""
+    referenceCrop = index.cropReference(reference)
+    gathered = metric == "mad" and not index.useSummedAreaTable
+    referencePixels = index.gather(referenceCrop) if gathered else None
+
+    def stage(items: Iterator[SampleItem]) -> Iterator[SampleResult]:
+        for item in items:
+            if item.error is not None:
+                yield SampleResult(item.filePath, None, item.error)
+                continue
+            with span("diff"):
+                if gathered:
+                    scores = scoreBatch(index, referencePixels, index.gather(item.image)[np.newaxis])[0]
+                else:
+                    scores = scoreRegions(index, metric, referenceCrop, item.image)
+            yield SampleResult(item.filePath, scores, None, item.transform, item.alignmentSeconds)
+
+    return stage
+
+
+def compareOnPool(
+    reference: cv2.Mat,
+    regions: list[Region],
+    workers: int | None = None,
+    maxInFlight: int | None = None,
+    metric: str = "mad",
+    aligner: Aligner | None = None,
+    executor: ProcessPoolExecutor | None = None,
+) -> Stage:
+    """Decode, align and diff on a process pool in one stage; results arrive in completion order."""
+
+    def stage(items: Iterator[SampleItem]) -> Iterator[SampleResult]:
+        samplePaths = (item.filePath for item in items)
+        return iterCompareSamplesParallel(
+            reference, regions, samplePaths, workers, maxInFlight, metric, aligner, executor
+        )
+
+    return stage
+
+
+def bounded(items: Iterator, depth: int) -> Iterator:
+    """Run an iterator on its own thread, at most `depth` items ahead of the consumer.
+
+    Closing the returned generator stops the thread once its current item is done, and waits for it."""
+    buffer: queue.Queue = queue.Queue(depth)
+    stopped = threading.Event()
+    end = object()
+    failure: list[BaseException] = []
+
+    def put(item: object) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    break
+        except BaseException as exception:  # Re-raised in the consumer.
+            failure.append(exception)
+        finally:
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()  # Runs the stage's cleanup, such as saving caches, on this thread.
+            put(end)
+
+    thread = threading.Thread(target=produce, name="PipelineStage", daemon=True)
+    thread.start()
+    try:
+        while (item := buffer.get()) is not end:
+            yield item
+        if failure:
+            raise failure[0]
+    finally:
+        stopped.set()
+        thread.join()
+
+
+class Pipeline:
+    """A chain of stages, each on its own thread behind a queue of `queueDepth` items.
+
+    Iterating `run` yields results as they leave the last stage; `stats` then
+    summarizes the run so far."""
+
+    def __init__(self, stages: list[Stage], queueDepth: int = DEFAULT_QUEUE_DEPTH):
+        self.stages = stages
+        self.queueDepth = queueDepth
+        self.compared = 0
+        self.failed = 0
+        self.alignmentSeconds = 0.0
+        self.start = time.perf_counter()
+
+    def run(self, items: Iterable[SampleItem]) -> Iterator[SampleResult]:
+        self.start = time.perf_counter()
+        stream: Iterator = iter(items)
+        for stage in self.stages:
+            stream = bounded(stage(stream), self.queueDepth)
+        try:
+            for result in stream:
+                self.compared += 1
+                self.failed += result.scores is None
+                self.alignmentSeconds += result.alignmentSeconds
+                yield result
+        finally:
+            stream.close()  # Stops every stage if the consumer stops early.
+
+    def stats(self) -> RunStats:
+        return RunStats(self.compared, time.perf_counter() - self.start, peakRSS(), self.alignmentSeconds)
+
+
+def comparisonPipeline(
+    reference: cv2.Mat,
+    regions: Iterable[Region],
+    metric: str = "mad",
+    aligner: Aligner | None = None,
+    workers: int | None = 1,
+    maxInFlight: int | None = None,
+    imageCache: ImageCache | None = None,
+    queueDepth: int = DEFAULT_QUEUE_DEPTH,
+    executor: ProcessPoolExecutor | None = None,
+) -> Pipeline:
+    """Build the standard pipeline. With `workers` other than 1 (None for one per CPU) the decode, align and diff
+    stages run on a process pool, `executor` if given; otherwise each runs on a thread of this process."""
+    regions = list(regions)
+    if workers != 1:
+        stage = compareOnPool(reference, regions, workers, maxInFlight, metric, aligner, executor)
+        return Pipeline([stage], queueDepth)
+
+    index = RegionIndex(reference.shape, regions)
+    if aligner is not None:
+        stages = [decodeFull(reference, imageCache), align(index, aligner)]
+    elif imageCache is not None:
+        stages = [decodeFull(reference, imageCache), cropRegions(index)]
+    else:
+        stages = [decodeRegions(reference, index)]
+    return Pipeline([*stages, diff(reference, index, metric)], queueDepth)
+
+
+class IncrementalComparison:
+    """Comparison that only computes the sample and region scores `database` does not hold yet.
+
+    Samples whose scores are all stored are yielded first, without being decoded.
+    The rest are grouped by which regions they miss and each group runs through a
+    `comparisonPipeline` over just those regions, so adding or moving one region
+    only computes that region. New scores are stored as they arrive. Only use it
+    from the thread that opened the database; the pipeline threads never touch it."""
+
+    def __init__(
+        self,
+        reference: cv2.Mat,
+        regions: Iterable[Region],
+        database: ResultDatabase,
+        metric: str = "mad",
+        aligner: Aligner | None = None,
+        workers: int | None = 1,
+        maxInFlight: int | None = None,
+        queueDepth: int = DEFAULT_QUEUE_DEPTH,
+        executor: ProcessPoolExecutor | None = None,
+    ):
+        self.reference = reference
+        self.regions = list(regions)
+        RegionIndex(reference.shape, self.regions)  # Fail early on invalid regions.
+        self.database = database
+        self.metric = metric
+        self.aligner = aligner
+        self.workers = workers
+        self.maxInFlight = maxInFlight
+        self.queueDepth = queueDepth
+        self.executor = executor
+        motion = aligner.motion if aligner is not None else None
+        self.regionKeys = regionKeys(imageFingerprint(reference), self.regions, metric, motion)
+
+        self.compared = 0
+        self.failed = 0
+        self.reused = 0
+        self.alignmentSeconds = 0.0
+        self.start = time.perf_counter()
+
+    def run(self, items: Iterable[SampleItem]) -> Iterator[SampleResult]:
+        self.start = time.perf_counter()
+        missingByRegions: dict[tuple[int, ...], dict[str, tuple[str, dict[str, float]]]] = {}
+        for samplePath in (item.filePath for item in items):
+            sampleHash = self.database.sampleHash(samplePath)
+            if sampleHash is None:
+                yield self.count(SampleResult(samplePath, None, "Could not read file."))
+                continue
+            known = self.database.scores(sampleHash, self.regionKeys)
+            missing = tuple(i for i, regionKey in enumerate(self.regionKeys) if regionKey not in known)
+            if missing:
+                missingByRegions.setdefault(missing, {})[samplePath] = sampleHash, known
+            else:
+                self.reused += 1
+                yield self.count(SampleResult(samplePath, np.array([known[key] for key in self.regionKeys])))
+        self.database.commit()
+
+        for missing, samples in missingByRegions.items():
+            missingKeys = [self.regionKeys[i] for i in missing]
+            pipeline = comparisonPipeline(
+                self.reference,
+                [self.regions[i] for i in missing],
+                self.metric,
+                self.aligner,
+                self.workers,
+                self.maxInFlight,
+                queueDepth=self.queueDepth,
+                executor=self.executor,
+            )
+            results = pipeline.run(SampleItem(samplePath) for samplePath in samples)
+            try:
+                for result in results:
+                    if result.scores is not None:
+                        sampleHash, known = samples[result.filePath]
+                        self.database.storeScores(sampleHash, missingKeys, result.scores)
+                        known.update(zip(missingKeys, result.scores))
+                        result = result._replace(scores=np.array([known[key] for key in self.regionKeys]))
+                    yield self.count(result)
+            finally:
+                results.close()
+                self.database.commit()
+
+    def count(self, result: SampleResult) -> SampleResult:
+        self.compared += 1
+        self.failed += result.scores is None
+        self.alignmentSeconds += result.alignmentSeconds
+        return result
+
+    def stats(self) -> RunStats:
+        return RunStats(self.compared, time.perf_counter() - self.start, peakRSS(), self.alignmentSeconds)
+
+
+class DeduplicatedComparison:
+    """Comparison that hashes every sample first and compares each group of near-duplicates once.
+
+    Samples are hashed from reduced decodes on a thread pool. With
+    `referenceHashes`, samples whose hashes all equal the reference's are not
+    compared but get the scores of the reference against itself. The rest are
+    grouped by `phash.groupNearDuplicates`; only the first sample of each group
+    goes through `comparison`, and the other members get its scores. Hashes
+    cannot see small changes, so this trades accuracy for speed."""
+
+    def __init__(
+        self,
+        comparison: Pipeline | IncrementalComparison,
+        reference: cv2.Mat,
+        regions: Iterable[Region],
+        metric: str = "mad",
+        referenceHashes: ImageHashes | None = None,
+        maxDistance: int = 0,
+        workers: int | None = None,
+    ):
+        self.comparison = comparison
+        self.reference = reference
+        self.index = RegionIndex(reference.shape, list(regions))
+        self.metric = metric
+        self.referenceHashes = referenceHashes
+        self.maxDistance = maxDistance
+        self.workers = workers
+
+        self.compared = 0
+        self.failed = 0
+        self.skipped = 0  # Identical to the reference.
+        self.grouped = 0  # Scored as a near-duplicate of another sample.
+        self.alignmentSeconds = 0.0
+        self.start = time.perf_counter()
+
+    def referenceScores(self) -> np.ndarray:
+        referenceCrop = self.index.cropReference(self.reference)
+        return scoreRegions(self.index, self.metric, referenceCrop, referenceCrop)
+
+    def run(self, items: Iterable[SampleItem]) -> Iterator[SampleResult]:
+        self.start = time.perf_counter()
+        samplePaths = [item.filePath for item in items]
+        with span("hash"), ThreadPoolExecutor(self.workers) as executor:
+            hashes = list(executor.map(hashFile, samplePaths))
+
+        unreadable, unique = [], []
+        referenceScores = None
+        for samplePath, sampleHashes in zip(samplePaths, hashes):
+            if sampleHashes is None:
+                unreadable.append(samplePath)  # Left to the comparison to report.
+            elif sampleHashes == self.referenceHashes:
+                if referenceScores is None:
+                    referenceScores = self.referenceScores()
+                self.skipped += 1
+                yield self.count(SampleResult(samplePath, referenceScores))
+            else:
+                unique.append((samplePath, sampleHashes))
+        groups = groupNearDuplicates(unique, self.maxDistance)
+
+        results = self.comparison.run(SampleItem(samplePath) for samplePath in [*groups, *unreadable])
+        try:
+            for result in results:
+                yield self.count(result)
+                for member in groups.get(result.filePath, ()):
+                    self.grouped += 1
+                    yield self.count(result._replace(filePath=member))
+        finally:
+            results.close()
+
+    def count(self, result: SampleResult) -> SampleResult:
+        self.compared += 1
+        self.failed += result.scores is None
+        self.alignmentSeconds += result.alignmentSeconds
+        return result
+
+    def stats(self) -> RunStats:
+        return RunStats(self.compared, time.perf_counter() - self.start, peakRSS(), self.alignmentSeconds)
@@ -0,0 +1,141 @@
+"""Timing spans around the operations that make the tool feel slow."""
+
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+ENVIRONMENT_VARIABLE = "IMAGEDIFFTOOL_PROFILE"
+MAX_SPANS = 100_000  # Oldest spans are dropped beyond this.
+
+
+class Span(NamedTuple):
+    name: str
+    start: int  # Nanoseconds on the monotonic clock.
+    duration: int  # Nanoseconds.
+    threadId: int
+
+
+class SpanSummary(NamedTuple):
+    name: str
+    count: int
+    totalSeconds: float
+    maxSeconds: float
+
+    @property
+    def meanSeconds(self) -> float:
+        return self.totalSeconds / self.count
+
+
+class _ActiveSpan:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exception):
+        end = time.perf_counter_ns()
+        recorded = Span(self.name, self.start, end - self.start, threading.get_ident())
+        self.profiler.spans.append(recorded)
+        self.profiler.latest[self.name] = recorded
+        return False
+
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+class Profiler:
+    """Collects spans from any thread; appending to the bounded deque needs no lock."""
+
+    def __init__(self, enabled: bool = False, maxSpans: int = MAX_SPANS):
+        self.enabled = enabled
+        self.spans: deque[Span] = deque(maxlen=maxSpans)
+        self.latest: dict[str, Span] = {}  # The most recent span of each operation.
+
+    def setEnabled(self, enabled: bool):
+        self.enabled = enabled
+
+    def span(self, name: str) -> contextlib.AbstractContextManager:
+        return _ActiveSpan(self, name) if self.enabled else _NO_SPAN
+
+    def clear(self):
+        self.spans.clear()
+        self.latest.clear()
+
+    def summary(self) -> list[SpanSummary]:
+        """Return the count, total and maximum duration of each operation, slowest total first."""
+        totals: dict[str, list[int]] = {}
+        for recorded in list(self.spans):
+            entry = totals.setdefault(recorded.name, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += recorded.duration
+            entry[2] = max(entry[2], recorded.duration)
+        summaries = [
+            SpanSummary(name, count, total / 1e9, longest / 1e9) for name, (count, total, longest) in totals.items()
+        ]
+        return sorted(summaries, key=lambda summary: summary.totalSeconds, reverse=True)
+
+    def chromeTrace(self) -> dict:
+        processId = os.getpid()
+        events = [
+            {
+                "name": recorded.name,
+                "cat": "imagedifftool",
+                "ph": "X",  # A complete event, with a duration.
+                "ts": recorded.start / 1000,
+                "dur": recorded.duration / 1000,
+                "pid": processId,
+                "tid": recorded.threadId,
+            }
+            for recorded in list(self.spans)
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def exportChromeTrace(self, path: str | Path):
+        Path(path).write_text(json.dumps(self.chromeTrace()))
+
+
+profiler = Profiler()
+
+
+def span(name: str) -> contextlib.AbstractContextManager:
+    return profiler.span(name)
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """Decorator recording every call of the function as a span."""
+
+    def decorate(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            with _ActiveSpan(profiler, name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def _enableFromEnvironment():
+    value = os.environ.get(ENVIRONMENT_VARIABLE, "")
+    if value in ("", "0"):
+        return
+    profiler.setEnabled(True)
+    if value.endswith(".json"):
+        atexit.register(profiler.exportChromeTrace, value)
+
+
+_enableFromEnvironment()
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import hashlib
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from profiling import timed
+from PyQt6 import sip
+from PyQt6.QtCore import QRect, QSize, Qt
+from PyQt6.QtGui import QIcon, QIconEngine, QImage, QPainter, QPixmap
+
+if TYPE_CHECKING:
+    import cv2
+
+# Formats whose memory layout matches OpenCV's channel order, keyed by (channels, dtype name).
+_DIRECT_FORMATS = {
+    (1, "uint8"): QImage.Format.Format_Grayscale8,
+    (1, "uint16"): QImage.Format.Format_Grayscale16,
+    (3, "uint8"): QImage.Format.Format_BGR888,
+}
+if sys.byteorder == "little":  # ARGB32 is stored as B, G, R, A on little-endian machines.
+    _DIRECT_FORMATS[(4, "uint8")] = QImage.Format.Format_ARGB32
+
+
+@timed("convert")
+def openCVToQImage(openCVImage: cv2.Mat) -> QImage:
+    """Wrap an OpenCV image in a QImage, without copying whenever the layout allows it.
+
+    Grayscale, BGR and BGRA images with 8-bit channels, and 16-bit grayscale, share
+    their pixels with the returned QImage; any image whose rows are themselves
+    contiguous qualifies, so crops of a larger image do too. Other inputs (16-bit
+    color, strided columns) are converted with a single copy. The backing array is
+    kept as the QImage's `array` attribute, so the pixels stay valid for as long as
+    that Python object is alive."""
+    channels = 1 if openCVImage.ndim == 2 else openCVImage.shape[2]
+    imageFormat = _DIRECT_FORMATS.get((channels, openCVImage.dtype.name))
+
+    if imageFormat is None:
+        openCVImage, imageFormat = _convertForDisplay(openCVImage, channels)
+    if openCVImage.strides[1] != openCVImage.itemsize * channels:  # Columns are not packed.
+        import numpy as np
+
+        openCVImage = np.ascontiguousarray(openCVImage)
+
+    height, width = openCVImage.shape[:2]
+    image = QImage(sip.voidptr(openCVImage.ctypes.data), width, height, openCVImage.strides[0], imageFormat)
+    image.array = openCVImage  # type: ignore
+    return image
+
+
+def _convertForDisplay(openCVImage: cv2.Mat, channels: int) -> tuple[cv2.Mat, QImage.Format]:
+    import cv2
+
+    if channels == 4 and openCVImage.dtype.name == "uint16":
+        return cv2.cvtColor(openCVImage, cv2.COLOR_BGRA2RGBA), QImage.Format.Format_RGBA64
+    if channels == 4 and openCVImage.dtype.name == "uint8":  # Big-endian machines only.
+        return cv2.cvtColor(openCVImage, cv2.COLOR_BGRA2RGBA), QImage.Format.Format_RGBA8888
+    if channels == 3 and openCVImage.dtype.name == "uint16":
+        return cv2.convertScaleAbs(openCVImage, alpha=1 / 257), QImage.Format.Format_BGR888
+    raise ValueError(f"Unsupported image: {channels} channel(s) of {openCVImage.dtype}.")
+
+
+_iconCacheDirectory: Path | None = None
+_rasterizedSvgs: dict[str, QPixmap] = {}
+
+
+def setIconCacheDirectory(directory: Path | None):
+    """Keep rasterized icons as PNG files in `directory`, so later runs skip parsing the SVGs."""
+    global _iconCacheDirectory
+    _iconCacheDirectory = directory
+    if directory is not None:
+        directory.mkdir(parents=True, exist_ok=True)
+
+
+def rasterizeSvg(svgStr: str) -> QPixmap:
+    """Rasterize an SVG at its own size, at most once per process (and once ever with an icon cache directory)."""
+    pixmap = _rasterizedSvgs.get(svgStr)
+    if pixmap is not None:
+        return pixmap
+
+    cachePath = None
+    if _iconCacheDirectory is not None:
+        cachePath = _iconCacheDirectory / f"{hashlib.blake2b(svgStr.encode(), digest_size=16).hexdigest()}.png"
+        pixmap = QPixmap(str(cachePath)) if cachePath.exists() else None
+
+    if pixmap is None or pixmap.isNull():
+        pixmap = QPixmap.fromImage(QImage.fromData(svgStr.encode()))  # type: ignore
+        if cachePath is not None:
+            pixmap.save(str(cachePath))
+
+    _rasterizedSvgs[svgStr] = pixmap
+    return pixmap
+
+
+class SvgIconEngine(QIconEngine):
+    """Icon engine that rasterizes its SVG the first time the icon is drawn rather than when it is created."""
+
+    def __init__(self, svgStr: str):
+        super().__init__()
+
+        self.svgStr = svgStr
+        self.icon: QIcon | None = None
+
+    def rasterizedIcon(self) -> QIcon:
+        if self.icon is None:
+            self.icon = QIcon(rasterizeSvg(self.svgStr))  # Derives the disabled and selected looks as usual.
+        return self.icon
+
+    def paint(self, painter: QPainter, rect: QRect, mode: QIcon.Mode, state: QIcon.State):
+        self.rasterizedIcon().paint(painter, rect, Qt.AlignmentFlag.AlignCenter, mode, state)
+
+    def pixmap(self, size: QSize, mode: QIcon.Mode, state: QIcon.State) -> QPixmap:
+        return self.rasterizedIcon().pixmap(size, mode, state)
+
+    def actualSize(self, size: QSize, mode: QIcon.Mode, state: QIcon.State) -> QSize:
+        return self.rasterizedIcon().actualSize(size, mode, state)
+
+    def clone(self) -> QIconEngine:
+        return SvgIconEngine(self.svgStr)
+
+
+def getIconFromSvg(svgStr: str) -> QIcon:
+    return QIcon(SvgIconEngine(svgStr))
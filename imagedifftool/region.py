@@ -0,0 +1,33 @@
+from typing import Iterable, NamedTuple
+
+
+class Region(NamedTuple):
+    x: int
+    y: int
+    width: int
+    height: int
+
+    def clipped(self, width: int, height: int) -> "Region":
+        """Return the part of the region that lies inside an image of the given size."""
+        x0, y0 = max(self.x, 0), max(self.y, 0)
+        x1, y1 = min(self.x + self.width, width), min(self.y + self.height, height)
+        return Region(x0, y0, max(x1 - x0, 0), max(y1 - y0, 0))
+
+    def isEmpty(self) -> bool:
+        return self.width <= 0 or self.height <= 0
+
+    def translated(self, dx: int, dy: int) -> "Region":
+        return Region(self.x + dx, self.y + dy, self.width, self.height)
+
+    def expanded(self, margin: int) -> "Region":
+        return Region(self.x - margin, self.y - margin, self.width + 2 * margin, self.height + 2 * margin)
+
+
+def boundingBox(regions: Iterable[Region]) -> Region:
+    """Return the smallest region containing every one of a non-empty collection of regions."""
+    regions = list(regions)
+    x0 = min(region.x for region in regions)
+    y0 = min(region.y for region in regions)
+    x1 = max(region.x + region.width for region in regions)
+    y1 = max(region.y + region.height for region in regions)
+    return Region(x0, y0, x1 - x0, y1 - y0)
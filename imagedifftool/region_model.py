@@ -0,0 +1,92 @@
+"""The regions selected on an image, with a spatial index for hit-testing."""
+
+from typing import Iterator
+
+from region import Region
+
+GRID_CELL_SIZE = 256
+
+
+class RegionModel:
+    def __init__(self, cellSize: int = GRID_CELL_SIZE):
+        self.cellSize = cellSize
+        self.records: dict[int, Region] = {}
+        self.grid: dict[tuple[int, int], set[int]] = {}
+        self.nextId = 0
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, regionId: int) -> bool:
+        return regionId in self.records
+
+    def regions(self) -> list[Region]:
+        return [self.records[regionId] for regionId in self.ids()]
+
+    def ids(self) -> list[int]:
+        return sorted(self.records)
+
+    def region(self, regionId: int) -> Region:
+        return self.records[regionId]
+
+    def add(self, region: Region, regionId: int | None = None) -> int:
+        """Add a region, under `regionId` if given, e.g. to restore a removed region in its place."""
+        if regionId is None:
+            regionId = self.nextId
+        self.nextId = max(self.nextId, regionId + 1)
+        self.records[regionId] = region
+        for cell in self.cells(region):
+            self.grid.setdefault(cell, set()).add(regionId)
+        return regionId
+
+    def remove(self, regionId: int) -> Region:
+        region = self.records.pop(regionId)
+        for cell in self.cells(region):
+            members = self.grid[cell]
+            members.discard(regionId)
+            if not members:
+                del self.grid[cell]
+        return region
+
+    def replace(self, regionId: int, region: Region):
+        """Move or resize a region, keeping its id."""
+        self.remove(regionId)
+        self.add(region, regionId)
+
+    def clear(self):
+        self.records.clear()
+        self.grid.clear()
+
+    def cells(self, region: Region) -> Iterator[tuple[int, int]]:
+        if region.isEmpty():
+            return
+        size = self.cellSize
+        for row in range(region.y // size, (region.y + region.height - 1) // size + 1):
+            for column in range(region.x // size, (region.x + region.width - 1) // size + 1):
+                yield column, row
+
+    def regionsIn(self, area: Region) -> list[int]:
+        """Return the ids of the regions overlapping an area, in drawing order."""
+        candidates = set()
+        for cell in self.cells(area):
+            candidates.update(self.grid.get(cell, ()))
+        x1, y1 = area.x + area.width, area.y + area.height
+        return sorted(
+            regionId
+            for regionId in candidates
+            if (region := self.records[regionId]).x < x1
+            and region.x + region.width > area.x
+            and region.y < y1
+            and region.y + region.height > area.y
+        )
+
+    def regionAt(self, x: float, y: float) -> int | None:
+        """Return the id of the topmost region containing a point, if any."""
+        cell = (int(x // self.cellSize), int(y // self.cellSize))
+        hits = [
+            regionId
+            for regionId in self.grid.get(cell, ())
+            if (region := self.records[regionId]).x <= x < region.x + region.width
+            and region.y <= y < region.y + region.height
+        ]
+        return max(hits, default=None)
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from PyQt6.QtCore import QRectF, Qt
+from PyQt6.QtGui import QColor, QPainter, QPen
+from PyQt6.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem, QWidget
+from profiling import timed
+from region import Region
+from region_model import RegionModel
+
+
+class RegionsItem(QGraphicsItem):
+    """Draws every region of a `RegionModel` as the outline of a rectangle.
+
+    One item stands for all regions, however many: painting asks the model for
+    the regions in the exposed area only, and adding or moving a region repaints
+    just the area it covers."""
+
+    def __init__(self, regionModel: RegionModel):
+        super().__init__()
+
+        self.regionModel = regionModel
+        self.selectedRegionId: int | None = None
+        self.size = (0, 0)
+        self.pen = QPen(QColor(0, 255, 0), 0)  # Zero width is a cosmetic one pixel pen at any zoom.
+        self.selectedPen = QPen(QColor(255, 220, 0), 2)
+        self.selectedPen.setCosmetic(True)
+
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+
+    def setSize(self, width: int, height: int):
+        self.prepareGeometryChange()
+        self.size = (width, height)
+
+    def boundingRect(self) -> QRectF:
+        return QRectF(0, 0, *self.size).adjusted(-2, -2, 2, 2)  # Room for the selection outline.
+
+    def updateRegion(self, region: Region):
+        self.update(QRectF(*region).adjusted(-2, -2, 2, 2))
+
+    def setSelectedRegionId(self, regionId: int | None):
+        for previous in (self.selectedRegionId, regionId):
+            if previous is not None and previous in self.regionModel:
+                self.updateRegion(self.regionModel.region(previous))
+        self.selectedRegionId = regionId
+
+    @timed("render regions")
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget | None = None):
+        exposed = option.exposedRect.toAlignedRect()
+        area = Region(exposed.x(), exposed.y(), exposed.width(), exposed.height())
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        painter.setPen(self.pen)
+        for regionId in self.regionModel.regionsIn(area):
+            if regionId != self.selectedRegionId:
+                painter.drawRect(QRectF(*self.regionModel.region(regionId)))
+        if self.selectedRegionId is not None and self.selectedRegionId in self.regionModel:
+            painter.setPen(self.selectedPen)
+            painter.drawRect(QRectF(*self.regionModel.region(self.selectedRegionId)))
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, QObject, Qt
+
+if TYPE_CHECKING:
+    from results_db import ResultDatabase
+
+
+class ResultTableModel(QAbstractTableModel):
+    """Sample and region scores of one session, read from the result database a page at a time.
+
+    Sorting and filtering are done by SQLite on its indexes, and rows are only
+    fetched as the view scrolls to them, so a session of any size opens at once
+    and e.g. the worst regions are the first page of a descending score sort."""
+
+    COLUMNS = ("Sample", "Region", "Score")
+    ORDERS = ("sample", "region", "score")  # Database column behind each column of the model.
+    PAGE_SIZE = 256
+
+    def __init__(self, databasePath: Path, parent: QObject | None = None):
+        super().__init__(parent)
+
+        self.databasePath = databasePath
+        self.database: ResultDatabase | None = None
+        self.sessionId: int | None = None
+        self.orderBy = "score"
+        self.descending = True
+        self.sampleFilter = ""
+        self.rows: list[tuple[str, int, float]] = []
+        self.exhausted = True
+
+    def setSession(self, sessionId: int | None):
+        self.sessionId = sessionId
+        self.refresh()
+
+    def setFilter(self, sampleFilter: str):
+        self.sampleFilter = sampleFilter
+        self.refresh()
+
+    def refresh(self):
+        """Drop the fetched rows, e.g. after new results were stored; the view fetches its first page again."""
+        self.beginResetModel()
+        self.rows = []
+        self.exhausted = self.sessionId is None
+        self.endResetModel()
+
+    def fetchPage(self) -> list[tuple[str, int, float]]:
+        if self.database is None:
+            from results_db import ResultDatabase
+
+            self.database = ResultDatabase(self.databasePath)
+        return self.database.resultPage(
+            self.sessionId, self.orderBy, self.descending, self.sampleFilter, self.PAGE_SIZE, len(self.rows)
+        )
+
+    def canFetchMore(self, parent: QModelIndex = QModelIndex()) -> bool:
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent: QModelIndex = QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        page = self.fetchPage()
+        self.exhausted = len(page) < self.PAGE_SIZE
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            self.rows.extend(page)
+            self.endInsertRows()
+
+    def sort(self, column: int, order: Qt.SortOrder = Qt.SortOrder.AscendingOrder):
+        self.orderBy = self.ORDERS[column]
+        self.descending = order == Qt.SortOrder.DescendingOrder
+        self.refresh()
+
+    def samplePath(self, row: int) -> str:
+        return self.rows[row][0]
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+        samplePath, region, score = self.rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return (Path(samplePath).name, region + 1, f"{score:.2f}")[index.column()]
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return samplePath
+        if role == Qt.ItemDataRole.TextAlignmentRole and index.column() > 0:
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+    def close(self):
+        if self.database is not None:
+            self.database.close()
+            self.database = None
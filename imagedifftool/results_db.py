@@ -0,0 +1,271 @@
+"""Persistent SQLite store of comparison scores and sessions."""
+
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, NamedTuple
+
+import cv2
+import numpy as np
+from engine import SampleResult
+from file_hash import CacheKey, cachedFileHash
+from orientation import Orientation
+from region import Region
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scores (
+    sampleHash TEXT NOT NULL,
+    regionKey TEXT NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (sampleHash, regionKey)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    reference TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    motion TEXT,
+    created REAL NOT NULL,
+    quarterTurns INTEGER NOT NULL DEFAULT 0,
+    mirrored INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS sessionRegions (
+    sessionId INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    region INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    PRIMARY KEY (sessionId, region)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sessionSamples (
+    sessionId INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    sample TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    error TEXT,
+    PRIMARY KEY (sessionId, sample)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS results (
+    sessionId INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    sample TEXT NOT NULL,
+    region INTEGER NOT NULL,
+    score REAL NOT NULL,
+    computed REAL NOT NULL,
+    PRIMARY KEY (sessionId, sample, region)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS resultsByScore ON results (sessionId, score);
+CREATE INDEX IF NOT EXISTS resultsByRegion ON results (sessionId, region, score);
+CREATE INDEX IF NOT EXISTS sessionSamplesByPosition ON sessionSamples (sessionId, position);
+"""
+
+RESULT_ORDERS = ("sample", "region", "score")  # Columns a result page can be sorted by.
+
+
+class Session(NamedTuple):
+    id: int
+    reference: str
+    metric: str
+    motion: str | None
+    created: float  # Seconds since the epoch.
+    regions: list[Region]  # In the coordinates of the reference in `orientation`, as compared.
+    samplePaths: list[str]
+    orientation: Orientation
+
+
+def imageFingerprint(openCVImage: cv2.Mat) -> str:
+    digest = hashlib.blake2b(str(openCVImage.shape).encode(), digest_size=16)
+    if openCVImage.flags.c_contiguous:
+        digest.update(openCVImage.data)
+    else:  # A rotated or mirrored view; hashing it a row at a time gives the same digest without copying it whole.
+        for row in openCVImage:
+            digest.update(np.ascontiguousarray(row).data)
+    return digest.hexdigest()
+
+
+def regionKeys(referenceFingerprint: str, regions: Iterable[Region], metric: str, motion: str | None) -> list[str]:
+    return [
+        hashlib.blake2b(
+            f"{referenceFingerprint} {tuple(region)} {metric} {motion}".encode(), digest_size=16
+        ).hexdigest()
+        for region in regions
+    ]
+
+
+class ResultDatabase:
+    """Connection to a result database. Like any SQLite connection, use it from the thread that opened it."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")  # Lets the GUI read while a run writes.
+        self.connection.execute("PRAGMA foreign_keys = ON")  # Off by default; deleting a session cascades to its rows.
+        self.connection.executescript(SCHEMA)
+        sessionColumns = {row[1] for row in self.connection.execute("PRAGMA table_info(sessions)")}
+        for column in ("quarterTurns", "mirrored"):  # Missing from databases created before these were.
+            if column not in sessionColumns:
+                self.connection.execute(f"ALTER TABLE sessions ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def commit(self):
+        self.connection.commit()
+
+    def sampleHash(self, filePath: str) -> str | None:
+        """Return the content hash of a file, only reading the file if it changed since it was last hashed, here or
+        by any other part of the process."""
+        key = CacheKey.fromFile(filePath)
+        if key is None:
+            return None
+        row = self.connection.execute("SELECT mtime, size, hash FROM files WHERE path = ?", (key.filePath,)).fetchone()
+        if row is not None and row[0] == key.mtime and row[1] == key.size:
+            return row[2]
+        try:
+            contentHash = cachedFileHash(key)
+        except OSError:
+            return None
+        self.connection.execute(
+            "INSERT OR REPLACE INTO files (path, mtime, size, hash) VALUES (?, ?, ?, ?)", (*key, contentHash)
+        )
+        return contentHash
+
+    def scores(self, sampleHash: str, regionKeys: list[str]) -> dict[str, float]:
+        """Return the stored scores of a sample for whichever of the regions have one."""
+        placeholders = ", ".join("?" * len(regionKeys))
+        rows = self.connection.execute(
+            f"SELECT regionKey, score FROM scores WHERE sampleHash = ? AND regionKey IN ({placeholders})",
+            (sampleHash, *regionKeys),
+        )
+        return dict(rows.fetchall())
+
+    def storeScores(self, sampleHash: str, regionKeys: list[str], scores: Iterable[float]):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO scores (sampleHash, regionKey, score) VALUES (?, ?, ?)",
+            [(sampleHash, regionKey, float(score)) for regionKey, score in zip(regionKeys, scores)],
+        )
+
+    def createSession(
+        self,
+        reference: str,
+        regions: Iterable[Region],
+        samplePaths: Iterable[str],
+        metric: str = "mad",
+        motion: str | None = None,
+        orientation: Orientation = Orientation(),
+    ) -> int:
+        cursor = self.connection.execute(
+            "INSERT INTO sessions (reference, metric, motion, created, quarterTurns, mirrored)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (reference, metric, motion, time.time(), orientation.quarterTurns, orientation.mirrored),
+        )
+        sessionId = cursor.lastrowid
+        self.connection.executemany(
+            "INSERT INTO sessionRegions (sessionId, region, x, y, width, height) VALUES (?, ?, ?, ?, ?, ?)",
+            [(sessionId, i, *region) for i, region in enumerate(regions)],
+        )
+        self.addSessionSamples(sessionId, samplePaths)
+        self.connection.commit()
+        return sessionId
+
+    def addSessionSamples(self, sessionId: int, samplePaths: Iterable[str]):
+        (count,) = self.connection.execute(
+            "SELECT COUNT(*) FROM sessionSamples WHERE sessionId = ?", (sessionId,)
+        ).fetchone()
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO sessionSamples (sessionId, sample, position) VALUES (?, ?, ?)",
+            [(sessionId, samplePath, count + i) for i, samplePath in enumerate(samplePaths)],
+        )
+
+    def recordResult(self, sessionId: int, result: SampleResult):
+        self.connection.execute(
+            "UPDATE sessionSamples SET error = ? WHERE sessionId = ? AND sample = ?",
+            (result.error, sessionId, result.filePath),
+        )
+        self.connection.execute("DELETE FROM results WHERE sessionId = ? AND sample = ?", (sessionId, result.filePath))
+        if result.scores is not None:
+            computed = time.time()
+            self.connection.executemany(
+                "INSERT INTO results (sessionId, sample, region, score, computed) VALUES (?, ?, ?, ?, ?)",
+                [(sessionId, result.filePath, i, float(score), computed) for i, score in enumerate(result.scores)],
+            )
+
+    def latestSession(self) -> Session | None:
+        row = self.connection.execute("SELECT MAX(id) FROM sessions").fetchone()
+        return self.session(row[0]) if row[0] is not None else None
+
+    def session(self, sessionId: int) -> Session | None:
+        row = self.connection.execute(
+            "SELECT reference, metric, motion, created, quarterTurns, mirrored FROM sessions WHERE id = ?", (sessionId,)
+        ).fetchone()
+        if row is None:
+            return None
+        regions = [
+            Region(*region)
+            for region in self.connection.execute(
+                "SELECT x, y, width, height FROM sessionRegions WHERE sessionId = ? ORDER BY region", (sessionId,)
+            )
+        ]
+        samplePaths = [
+            sample
+            for (sample,) in self.connection.execute(
+                "SELECT sample FROM sessionSamples WHERE sessionId = ? ORDER BY position", (sessionId,)
+            )
+        ]
+        reference, metric, motion, created, quarterTurns, mirrored = row
+        orientation = Orientation(quarterTurns, bool(mirrored))
+        return Session(sessionId, reference, metric, motion, created, regions, samplePaths, orientation)
+
+    def sessionResults(self, sessionId: int) -> list[SampleResult]:
+        """Return the stored result of every compared sample of a session, in sample order."""
+        (regionCount,) = self.connection.execute(
+            "SELECT COUNT(*) FROM sessionRegions WHERE sessionId = ?", (sessionId,)
+        ).fetchone()
+        scores: dict[str, np.ndarray] = {}
+        for sample, region, score in self.connection.execute(
+            "SELECT sample, region, score FROM results WHERE sessionId = ?", (sessionId,)
+        ):
+            scores.setdefault(sample, np.full(regionCount, np.nan))[region] = score
+
+        results = []
+        for sample, error in self.connection.execute(
+            "SELECT sample, error FROM sessionSamples WHERE sessionId = ? ORDER BY position", (sessionId,)
+        ):
+            if sample in scores:
+                results.append(SampleResult(sample, scores[sample]))
+            elif error is not None:
+                results.append(SampleResult(sample, None, error))
+        return results
+
+    def resultPage(
+        self,
+        sessionId: int,
+        orderBy: str = "score",
+        descending: bool = True,
+        sampleFilter: str = "",
+        limit: int = 256,
+        offset: int = 0,
+    ) -> list[tuple[str, int, float]]:
+        """Return (sample, region, score) rows of a session, sorted and filtered in SQLite.
+
+        `sampleFilter` keeps samples whose path contains it. Sorting by score or
+        region reads the rows in index order, so e.g. the 50 worst regions of a
+        large session come back without sorting the whole session."""
+        if orderBy not in RESULT_ORDERS:
+            raise ValueError(f"Cannot order results by {orderBy!r}.")
+        direction = "DESC" if descending else "ASC"
+        query = "SELECT sample, region, score FROM results WHERE sessionId = ?"
+        parameters: list = [sessionId]
+        if sampleFilter:
+            escaped = sampleFilter.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            query += " AND sample LIKE ? ESCAPE '\\'"
+            parameters.append(f"%{escaped}%")
+        query += f" ORDER BY {orderBy} {direction}, sample {direction}, region {direction} LIMIT ? OFFSET ?"
+        return self.connection.execute(query, (*parameters, limit, offset)).fetchall()
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from PyQt6.QtCore import QAbstractListModel, QModelIndex, QObject, QRunnable, Qt, QThreadPool, pyqtSignal, pyqtSlot
+from PyQt6.QtGui import QIcon, QImage, QPixmap
+from qt_image_tools import openCVToQImage
+
+if TYPE_CHECKING:
+    from engine import SampleResult
+    from thumbnails import ThumbnailCache
+
+
+class ThumbnailLoaderSignals(QObject):
+    loadedSignal = pyqtSignal(int, str, object)
+
+
+class ThumbnailLoader(QRunnable):
+    def __init__(self, generation: int, filePath: str, thumbnailCache: ThumbnailCache):
+        super().__init__()
+
+        self.generation = generation
+        self.filePath = filePath
+        self.thumbnailCache = thumbnailCache
+        self.signals = ThumbnailLoaderSignals()
+
+    def run(self):
+        thumbnail = self.thumbnailCache.getThumbnail(self.filePath)
+        image = openCVToQImage(thumbnail) if thumbnail is not None else None
+        self.signals.loadedSignal.emit(self.generation, self.filePath, image)
+
+
+class SampleListModel(QAbstractListModel):
+    """List of sample files whose thumbnails are generated on demand.
+
+    Views only ask for the decoration of rows they display, so thumbnails are
+    produced for visible rows only, on a dedicated thread pool. The thumbnail
+    cache, and with it cv2, is only set up once the first thumbnail is needed.
+    Comparison results are shown under the name of their sample as they arrive."""
+
+    def __init__(self, thumbnailDirectory: Path, parent: QObject | None = None):
+        super().__init__(parent)
+
+        self.thumbnailDirectory = thumbnailDirectory
+        self.thumbnailCache: ThumbnailCache | None = None
+        self.samplePaths: list[str] = []
+        self.rows: dict[str, int] = {}
+        self.icons: dict[str, QIcon] = {}
+        self.results: dict[str, SampleResult] = {}
+        self.pending: set[str] = set()
+        self.generation = 0
+
+        self.threadPool = QThreadPool(self)
+        self.threadPool.setMaxThreadCount(max(QThreadPool.globalInstance().maxThreadCount() // 2, 1))
+
+    def setSamplePaths(self, samplePaths: list[str]):
+        self.beginResetModel()
+        self.threadPool.clear()
+        self.generation += 1
+        self.samplePaths = list(samplePaths)
+        self.rows = {samplePath: row for row, samplePath in enumerate(self.samplePaths)}
+        self.icons.clear()
+        self.results.clear()
+        self.pending.clear()
+        self.endResetModel()
+
+    def addSamplePaths(self, samplePaths: list[str]):
+        first = len(self.samplePaths)
+        self.beginInsertRows(QModelIndex(), first, first + len(samplePaths) - 1)
+        self.samplePaths.extend(samplePaths)
+        self.rows.update((samplePath, first + i) for i, samplePath in enumerate(samplePaths))
+        self.endInsertRows()
+
+    def invalidateThumbnail(self, samplePath: str):
+        """Regenerate a sample's thumbnail the next time it is shown, e.g. after the file changed."""
+        row = self.rows.get(samplePath)
+        if row is None or self.icons.pop(samplePath, None) is None:
+            return
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+    def setResult(self, result: SampleResult):
+        row = self.rows.get(result.filePath)
+        if row is None:
+            return
+        self.results[result.filePath] = result
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole])
+
+    def clearResults(self):
+        if not self.results:
+            return
+        self.results.clear()
+        self.dataChanged.emit(
+            self.index(0),
+            self.index(len(self.samplePaths) - 1),
+            [Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole],
+        )
+
+    def samplePath(self, row: int) -> str:
+        return self.samplePaths[row]
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.samplePaths)
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+        samplePath = self.samplePaths[index.row()]
+
+        result = self.results.get(samplePath)
+        if role == Qt.ItemDataRole.DisplayRole:
+            if result is None:
+                return Path(samplePath).name
+            if result.scores is None:
+                return f"{Path(samplePath).name}\nFailed"
+            return f"{Path(samplePath).name}\nMax {max(result.scores):.2f}"
+        if role == Qt.ItemDataRole.ToolTipRole:
+            if result is None:
+                return samplePath
+            if result.scores is None:
+                return f"{samplePath}\n{result.error}"
+            return f"{samplePath}\n" + ", ".join(f"{score:.2f}" for score in result.scores)
+        if role == Qt.ItemDataRole.DecorationRole:
+            icon = self.icons.get(samplePath)
+            if icon is None and samplePath not in self.pending:
+                self.requestThumbnail(samplePath)
+            return icon
+        return None
+
+    def requestThumbnail(self, samplePath: str):
+        if self.thumbnailCache is None:
+            from thumbnails import ThumbnailCache
+
+            self.thumbnailCache = ThumbnailCache(self.thumbnailDirectory)
+        self.pending.add(samplePath)
+        loader = ThumbnailLoader(self.generation, samplePath, self.thumbnailCache)
+        loader.signals.loadedSignal.connect(self.onThumbnailLoaded)
+        self.threadPool.start(loader)
+
+    @pyqtSlot(int, str, object)
+    def onThumbnailLoaded(self, generation: int, samplePath: str, image: QImage | None):
+        if generation != self.generation:
+            return
+        self.pending.discard(samplePath)
+        self.icons[samplePath] = QIcon(QPixmap.fromImage(image)) if image is not None else QIcon()
+
+        index = self.index(self.rows[samplePath])
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
@@ -0,0 +1,198 @@
+"""Parallel sample comparison on a process pool."""
+
+import contextlib
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from multiprocessing.shared_memory import SharedMemory
+from typing import Iterable, Iterator, NamedTuple
+
+import cv2
+import numpy as np
+from alignment import Aligner
+from engine import RegionIndex, SampleResult, compareSample, loadSamplePixels, scoreBatch
+from image_store import ImageStore
+from image_tools import getImageStore, setImageStore
+from region import Region
+
+try:
+    import resource
+except ImportError:  # Windows.
+    resource = None
+
+
+class RunStats(NamedTuple):
+    samples: int
+    seconds: float
+    peakRSS: int | None  # Bytes, the largest of the main process and any worker.
+    alignmentSeconds: float = 0.0  # Summed over samples, so it can exceed `seconds` on a pool.
+
+    @property
+    def samplesPerSecond(self) -> float:
+        return self.samples / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        text = f"{self.samples} sample(s) in {self.seconds:.2f}s ({self.samplesPerSecond:.1f} samples/s)"
+        if self.peakRSS is not None:
+            text += f", peak RSS {self.peakRSS / 2**20:.0f} MiB"
+        if self.alignmentSeconds:
+            text += f", alignment {self.alignmentSeconds:.2f}s"
+        return text
+
+
+def peakRSS() -> int | None:
+    """Peak resident set size in bytes of this process and its reaped children."""
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is in KiB on Linux.
+    ownPeak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    childPeak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(ownPeak, childPeak) * scale
+
+
+_worker: dict[str, object] = {}
+
+
+def createWorkerPool(workers: int | None = None) -> ProcessPoolExecutor:
+    """A process pool that can run any number of comparisons, one after the other or at once."""
+    return ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count() or 1,
+        mp_context=multiprocessing.get_context("spawn"),  # Forking a process that runs Qt is unsafe.
+    )
+
+
+def _initWorker(
+    sharedMemoryName: str,
+    shape: tuple[int, ...],
+    dtype: str,
+    regions: list[Region],
+    storeDirectory: str | None,
+    metric: str,
+    motion: str | None,
+):
+    sharedMemory = SharedMemory(sharedMemoryName)
+    previous: SharedMemory | None = _worker.pop("sharedMemory", None)  # type: ignore
+    _worker.clear()  # Drops the arrays mapping the previous comparison's reference, so it can be closed.
+    if previous is not None:
+        previous.close()
+    setImageStore(ImageStore(storeDirectory) if storeDirectory is not None else None)
+    reference = np.ndarray(shape, dtype=np.dtype(dtype), buffer=sharedMemory.buf)
+    index = RegionIndex(shape, regions)
+    _worker["sharedMemory"] = sharedMemory  # Kept mapped until the worker moves on to another comparison.
+    _worker["reference"] = reference
+    _worker["index"] = index
+    _worker["metric"] = metric
+    _worker["aligner"] = Aligner(reference, regions, motion) if motion is not None else None
+    _worker["referencePixels"] = index.gather(index.crop(reference)) if not index.useSummedAreaTable else None
+
+
+def _compareInWorker(samplePath: str, transform: np.ndarray | None, initArguments: tuple) -> SampleResult:
+    sharedMemory: SharedMemory | None = _worker.get("sharedMemory")  # type: ignore
+    if sharedMemory is None or sharedMemory.name != initArguments[0]:  # The first task of a comparison here.
+        _initWorker(*initArguments)
+    reference: cv2.Mat = _worker["reference"]  # type: ignore
+    index: RegionIndex = _worker["index"]  # type: ignore
+    referencePixels: np.ndarray = _worker["referencePixels"]  # type: ignore
+    metric: str = _worker["metric"]  # type: ignore
+    aligner: Aligner | None = _worker["aligner"]  # type: ignore
+
+    if metric != "mad" or index.useSummedAreaTable or aligner is not None:
+        return compareSample(samplePath, reference, index, metric, None, aligner, transform)
+    samplePixels = loadSamplePixels(samplePath, reference, index)
+    if isinstance(samplePixels, str):
+        return SampleResult(samplePath, None, samplePixels)
+    return SampleResult(samplePath, scoreBatch(index, referencePixels, samplePixels[np.newaxis])[0])
+
+
+def iterCompareSamplesParallel(
+    reference: cv2.Mat,
+    regions: Iterable[Region],
+    samplePaths: Iterable[str],
+    workers: int | None = None,
+    maxInFlight: int | None = None,
+    metric: str = "mad",
+    aligner: Aligner | None = None,
+    executor: ProcessPoolExecutor | None = None,
+) -> Iterator[SampleResult]:
+    """Compare samples on a process pool, yielding results in completion order.
+
+    At most `maxInFlight` samples are submitted at once; since a worker only holds
+    one decoded sample at a time, no more than min(workers, maxInFlight) decoded
+    samples exist at any moment regardless of how many paths are given.
+
+    With an `aligner`, this process looks up cached transforms and passes them to
+    the workers, which estimate the missing ones; new transforms are cached here.
+
+    The pool is `executor` if given, which is left running for later comparisons;
+    otherwise one of `workers` processes is started for this comparison alone."""
+    regions = list(regions)
+    RegionIndex(reference.shape, regions)  # Fail early on invalid regions rather than in every worker.
+    workers = workers or os.cpu_count() or 1
+    maxInFlight = maxInFlight or 2 * workers
+
+    imageStore = getImageStore()
+    storeDirectory = str(imageStore.directory) if imageStore is not None else None
+
+    sharedMemory = SharedMemory(create=True, size=max(reference.nbytes, 1))
+    initArguments = (
+        sharedMemory.name,
+        reference.shape,
+        reference.dtype.str,
+        regions,
+        storeDirectory,
+        metric,
+        aligner.motion if aligner is not None else None,
+    )
+    pending: set[Future[SampleResult]] = set()
+    try:
+        np.ndarray(reference.shape, dtype=reference.dtype, buffer=sharedMemory.buf)[...] = reference
+        with contextlib.nullcontext(executor) if executor is not None else createWorkerPool(workers) as pool:
+
+            def collect(future: Future[SampleResult]) -> SampleResult:
+                result = future.result()
+                if aligner is not None and result.alignmentSeconds and result.transform is not None:
+                    aligner.rememberTransform(result.filePath, result.transform)
+                return result
+
+            for samplePath in samplePaths:
+                if len(pending) >= maxInFlight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from (collect(future) for future in done)
+                transform = aligner.cachedTransform(samplePath) if aligner is not None else None
+                pending.add(pool.submit(_compareInWorker, samplePath, transform, initArguments))
+            for future in pending:
+                yield collect(future)
+            pending.clear()
+    finally:
+        for future in pending:  # Abandoned; a shared pool would otherwise still run them.
+            future.cancel()
+        sharedMemory.close()
+        sharedMemory.unlink()
+        if aligner is not None:
+            aligner.saveCache()
+
+
+def compareSamplesParallel(
+    reference: cv2.Mat,
+    regions: Iterable[Region],
+    samplePaths: Iterable[str],
+    workers: int | None = None,
+    maxInFlight: int | None = None,
+    metric: str = "mad",
+    aligner: Aligner | None = None,
+    executor: ProcessPoolExecutor | None = None,
+) -> tuple[list[SampleResult], RunStats]:
+    """Compare samples on a process pool and return the results in input order along with run statistics."""
+    samplePaths = list(samplePaths)
+    start = time.perf_counter()
+    resultsByPath = {
+        result.filePath: result
+        for result in iterCompareSamplesParallel(
+            reference, regions, samplePaths, workers, maxInFlight, metric, aligner, executor
+        )
+    }
+    alignmentSeconds = sum(result.alignmentSeconds for result in resultsByPath.values())
+    stats = RunStats(len(samplePaths), time.perf_counter() - start, peakRSS(), alignmentSeconds)
+    return [resultsByPath[samplePath] for samplePath in samplePaths], stats
@@ -0,0 +1,80 @@
+import os
+import threading
+from pathlib import Path
+
+import cv2
+from file_hash import CacheKey, cachedFileHash
+
+THUMBNAIL_SIZE = 64
+
+# Reduced decodes, finest last. Only JPEG decodes these directly at the lower scale; other formats decode in full
+# then shrink, so they are decoded once at full scale instead.
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+    (1, cv2.IMREAD_COLOR),
+)
+_JPEG_SUFFIXES = (".jpg", ".jpeg", ".jpe", ".jfif")
+
+
+def defaultThumbnailDirectory() -> Path:
+    cacheHome = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cacheHome) / "imagedifftool" / "thumbnails"
+
+
+def makeThumbnail(filePath: str, size: int = THUMBNAIL_SIZE) -> cv2.Mat | None:
+    """Decode a file, a JPEG at the coarsest reduction that still covers `size` pixels, and shrink it to fit."""
+    openCVImage = None
+    reducedFlags = _REDUCED_FLAGS if filePath.lower().endswith(_JPEG_SUFFIXES) else _REDUCED_FLAGS[-1:]
+    for reduction, flag in reducedFlags:
+        openCVImage = cv2.imread(filePath, flag)
+        if openCVImage is None:
+            return None
+        if reduction == 1 or max(openCVImage.shape[:2]) >= size:
+            break
+
+    assert openCVImage is not None
+    height, width = openCVImage.shape[:2]
+    scale = size / max(height, width)
+    if scale >= 1:
+        return openCVImage
+    return cv2.resize(
+        openCVImage, (max(round(width * scale), 1), max(round(height * scale), 1)), interpolation=cv2.INTER_AREA
+    )
+
+
+class ThumbnailCache:
+    """Thumbnails stored on disk by content hash, so renamed or copied files reuse them."""
+
+    def __init__(self, directory: Path | None = None, size: int = THUMBNAIL_SIZE):
+        self.directory = directory or defaultThumbnailDirectory()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.size = size
+
+    def thumbnailPath(self, filePath: str) -> Path | None:
+        key = CacheKey.fromFile(filePath)
+        if key is None:
+            return None
+        try:
+            contentHash = cachedFileHash(key)
+        except OSError:
+            return None
+        return self.directory / f"{contentHash}-{self.size}.png"
+
+    def getThumbnail(self, filePath: str) -> cv2.Mat | None:
+        """Return the thumbnail for a file, generating and storing it if needed."""
+        thumbnailPath = self.thumbnailPath(filePath)
+        if thumbnailPath is None:
+            return None
+        if thumbnailPath.exists():
+            thumbnail = cv2.imread(str(thumbnailPath))
+            if thumbnail is not None:
+                return thumbnail
+
+        thumbnail = makeThumbnail(filePath, self.size)
+        if thumbnail is not None:
+            temporaryPath = thumbnailPath.with_suffix(f".{threading.get_ident()}.tmp.png")
+            cv2.imwrite(str(temporaryPath), thumbnail)
+            os.replace(temporaryPath, thumbnailPath)  # Concurrent writers never expose a partial file.
+        return thumbnail
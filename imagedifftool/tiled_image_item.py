@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import math
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+from profiling import span, timed
+from PyQt6.QtCore import QRectF
+from PyQt6.QtGui import QPainter, QPixmap
+from PyQt6.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem, QWidget
+from qt_image_tools import openCVToQImage
+
+if TYPE_CHECKING:
+    import cv2
+    from image_tools import ImagePyramid
+
+TILE_SIZE = 512
+
+
+class TiledImageItem(QGraphicsItem):
+    """Draws an image pyramid tile by tile.
+
+    Only tiles intersecting the exposed area are drawn, taken from the pyramid level
+    matching the current zoom, and converted to pixmaps on first use. Pixmaps are
+    kept in an LRU cache bounded by `MAX_CACHED_TILE_BYTES`."""
+
+    MAX_CACHED_TILE_BYTES = 256 * 2**20
+    TILE_SPAN = "tile"  # Name of the profiling span of making a tile's pixmap.
+
+    def __init__(self):
+        super().__init__()
+
+        self.pyramid: ImagePyramid | None = None
+        self.tiles: OrderedDict[tuple[int, int, int], QPixmap] = OrderedDict()
+        self.cachedTileBytes = 0
+
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+
+    def setPyramid(self, pyramid: ImagePyramid | None):
+        self.prepareGeometryChange()
+        self.pyramid = pyramid
+        self.tiles.clear()
+        self.cachedTileBytes = 0
+        self.update()
+
+    def isNull(self) -> bool:
+        return self.pyramid is None
+
+    def boundingRect(self) -> QRectF:
+        if self.pyramid is None:
+            return QRectF()
+        return QRectF(0, 0, self.pyramid.width, self.pyramid.height)
+
+    @timed("render")
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget | None = None):
+        if self.pyramid is None:
+            return
+
+        scale = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        level = self.pyramid.levelForScale(scale)
+        scaleX, scaleY = self.pyramid.levelScale(level)
+        levelHeight, levelWidth = self.pyramid.levels[level].shape[:2]
+
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        firstColumn = max(int(exposed.left() / scaleX) // TILE_SIZE, 0)
+        lastColumn = min(int(math.ceil(exposed.right() / scaleX)) // TILE_SIZE, (levelWidth - 1) // TILE_SIZE)
+        firstRow = max(int(exposed.top() / scaleY) // TILE_SIZE, 0)
+        lastRow = min(int(math.ceil(exposed.bottom() / scaleY)) // TILE_SIZE, (levelHeight - 1) // TILE_SIZE)
+
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        for row in range(firstRow, lastRow + 1):
+            for column in range(firstColumn, lastColumn + 1):
+                pixmap = self.tile(level, column, row)
+                target = QRectF(
+                    column * TILE_SIZE * scaleX,
+                    row * TILE_SIZE * scaleY,
+                    pixmap.width() * scaleX,
+                    pixmap.height() * scaleY,
+                )
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+
+    def tile(self, level: int, column: int, row: int) -> QPixmap:
+        key = (level, column, row)
+        pixmap = self.tiles.get(key)
+        if pixmap is not None:
+            self.tiles.move_to_end(key)
+            return pixmap
+
+        with span(self.TILE_SPAN):
+            tileImage = self.tileImage(level, column, row)
+            pixmap = QPixmap.fromImage(openCVToQImage(tileImage))  # The only copy between decode and screen.
+
+        self.tiles[key] = pixmap
+        self.cachedTileBytes += self.tileBytes(pixmap)
+        while self.cachedTileBytes > self.MAX_CACHED_TILE_BYTES and len(self.tiles) > 1:
+            _, evicted = self.tiles.popitem(last=False)
+            self.cachedTileBytes -= self.tileBytes(evicted)
+        return pixmap
+
+    def tileImage(self, level: int, column: int, row: int) -> cv2.Mat:
+        """Return the pixels of a tile; subclasses may derive them from the pyramid instead."""
+        assert self.pyramid is not None
+        x, y = column * TILE_SIZE, row * TILE_SIZE
+        return self.pyramid.levels[level][y : y + TILE_SIZE, x : x + TILE_SIZE]
+
+    @staticmethod
+    def tileBytes(pixmap: QPixmap) -> int:
+        return pixmap.width() * pixmap.height() * pixmap.depth() // 8
@@ -0,0 +1,95 @@
+from abc import ABC, abstractmethod
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+
+class UndoCommand(ABC):
+    """One undoable edit. `redo` applies it, also the first time when the command is pushed."""
+
+    text = ""
+
+    @abstractmethod
+    def redo(self):
+        pass
+
+    @abstractmethod
+    def undo(self):
+        pass
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes the command keeps alive to be undone or redone, beyond what is shown."""
+        return 0
+
+
+class UndoStack(QObject):
+    """A stack of commands in the manner of `QUndoStack`, bounded by a count and by the bytes the commands hold.
+
+    The oldest commands are dropped when either bound is exceeded, so history
+    never holds more than `maxBytes` of image data, however large the images."""
+
+    changedSignal = pyqtSignal()
+
+    def __init__(self, maxBytes: int = 256 * 2**20, maxCommands: int = 1000):
+        super().__init__()
+
+        self.maxBytes = maxBytes
+        self.maxCommands = maxCommands
+        self.commands: list[UndoCommand] = []
+        self.index = 0  # Commands before the index are done, the rest undone.
+
+    @property
+    def currentBytes(self) -> int:
+        return sum(command.nbytes for command in self.commands)
+
+    def setMaxBytes(self, maxBytes: int):
+        self.maxBytes = maxBytes
+        self.trim()
+        self.changedSignal.emit()
+
+    def push(self, command: UndoCommand):
+        command.redo()
+        del self.commands[self.index :]
+        self.commands.append(command)
+        self.index += 1
+        self.trim()
+        self.changedSignal.emit()
+
+    def trim(self):
+        while self.commands and (len(self.commands) > self.maxCommands or self.currentBytes > self.maxBytes):
+            if self.index:
+                del self.commands[0]
+                self.index -= 1
+            else:  # Everything is undone; the last redo goes first.
+                self.commands.pop()
+
+    def canUndo(self) -> bool:
+        return self.index > 0
+
+    def canRedo(self) -> bool:
+        return self.index < len(self.commands)
+
+    def undoText(self) -> str:
+        return self.commands[self.index - 1].text if self.canUndo() else ""
+
+    def redoText(self) -> str:
+        return self.commands[self.index].text if self.canRedo() else ""
+
+    def undo(self):
+        if not self.canUndo():
+            return
+        self.index -= 1
+        self.commands[self.index].undo()
+        self.changedSignal.emit()
+
+    def redo(self):
+        if not self.canRedo():
+            return
+        self.commands[self.index].redo()
+        self.index += 1
+        self.changedSignal.emit()
+
+    def clear(self):
+        self.commands.clear()
+        self.index = 0
+        self.changedSignal.emit()
@@ -0,0 +1,125 @@
+"""The undoable edits of an `ImageView`."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from orientation import Orientation
+from region import Region
+from undo_stack import UndoCommand
+
+if TYPE_CHECKING:
+    from image_view import ImageView
+
+
+class AddRegionCommand(UndoCommand):
+    text = "Add Region"
+
+    def __init__(self, view: ImageView, region: Region):
+        self.view = view
+        self.region = region
+        self.regionId: int | None = None  # Assigned the first time; kept so later commands find the region.
+
+    def redo(self):
+        self.regionId = self.view.addRegion(self.region, self.regionId)
+        self.view.selectRegion(self.regionId)
+
+    def undo(self):
+        self.view.removeRegion(self.regionId)
+
+
+class AddRegionsCommand(UndoCommand):
+    def __init__(self, view: ImageView, text: str, regions: list[Region]):
+        self.view = view
+        self.text = text
+        self.regions = regions
+        self.regionIds: list[int | None] = [None] * len(regions)
+
+    def redo(self):
+        self.regionIds = [
+            self.view.addRegion(region, regionId) for region, regionId in zip(self.regions, self.regionIds)
+        ]
+
+    def undo(self):
+        for regionId in self.regionIds:
+            self.view.removeRegion(regionId)
+
+
+class RemoveRegionCommand(UndoCommand):
+    text = "Delete Region"
+
+    def __init__(self, view: ImageView, regionId: int):
+        self.view = view
+        self.regionId = regionId
+        self.region = view.regionModel.region(regionId)
+
+    def redo(self):
+        self.view.removeRegion(self.regionId)
+
+    def undo(self):
+        self.view.addRegion(self.region, self.regionId)
+        self.view.selectRegion(self.regionId)
+
+
+class MoveRegionCommand(UndoCommand):
+    text = "Move Region"
+
+    def __init__(self, view: ImageView, regionId: int, previous: Region, region: Region):
+        self.view = view
+        self.regionId = regionId
+        self.previous = previous
+        self.region = region
+
+    def redo(self):
+        self.view.moveRegion(self.regionId, self.region)
+
+    def undo(self):
+        self.view.moveRegion(self.regionId, self.previous)
+
+
+class OrientationCommand(UndoCommand):
+    def __init__(self, view: ImageView, text: str, orientation: Orientation):
+        self.view = view
+        self.text = text
+        self.previous = view.orientation
+        self.orientation = orientation
+
+    def redo(self):
+        self.view.setOrientation(self.orientation)
+
+    def undo(self):
+        self.view.setOrientation(self.previous)
+
+
+class CropCommand(UndoCommand):
+    """Keeps the pyramid shown before the crop, so undoing shows it again without decoding or copying pixels."""
+
+    text = "Crop to Selection"
+
+    def __init__(self, view: ImageView, crop: Region):
+        self.view = view
+        self.crop = crop
+        self.pyramid = view.imageItem.pyramid
+        self.records = dict(view.regionModel.records)
+        self.selectedRegionId = view.selectedRegionId
+        self.cropOrigin = view.cropOrigin
+
+    def redo(self):
+        from image_tools import ImagePyramid
+
+        crop = self.crop
+        image = self.pyramid.levels[0][crop.y : crop.y + crop.height, crop.x : crop.x + crop.width]
+        records = {}
+        for regionId, region in self.records.items():
+            region = region.translated(-crop.x, -crop.y).clipped(crop.width, crop.height)
+            if not region.isEmpty():
+                records[regionId] = region
+        cropOrigin = (self.cropOrigin[0] + crop.x, self.cropOrigin[1] + crop.y)
+        self.view.showImage(ImagePyramid(image), records, self.selectedRegionId, cropOrigin)
+
+    def undo(self):
+        self.view.showImage(self.pyramid, self.records, self.selectedRegionId, self.cropOrigin)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(level.nbytes for level in self.pyramid.levels[1:])
@@ -0,0 +1,46 @@
+"""Detection of new and modified sample files in a watched directory."""
+
+import os
+import time
+from typing import Iterator
+
+from pipeline import findSamples
+
+
+class DirectoryPoller:
+    """Finds image files in a directory that are new or changed since they were last reported.
+
+    A file is only reported once its size and modification time are the same on
+    two consecutive scans, so a file that is still being written is picked up
+    when it is complete rather than half-way through."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.previousScan: dict[str, tuple[int, int]] = {}
+        self.reported: dict[str, tuple[int, int]] = {}
+
+    def scan(self) -> list[str]:
+        currentScan = {}
+        for filePath in findSamples([self.directory]):
+            try:
+                stat = os.stat(filePath)
+            except OSError:
+                continue  # Removed between listing and stat.
+            currentScan[filePath] = (stat.st_mtime_ns, stat.st_size)
+
+        changed = [
+            filePath
+            for filePath, signature in currentScan.items()
+            if self.previousScan.get(filePath) == signature and self.reported.get(filePath) != signature
+        ]
+        self.reported.update((filePath, currentScan[filePath]) for filePath in changed)
+        self.previousScan = currentScan
+        return changed
+
+    def watch(self, interval: float = 1.0) -> Iterator[list[str]]:
+        """Scan forever, yielding each non-empty list of new or modified files."""
+        while True:
+            changed = self.scan()
+            if changed:
+                yield changed
+            time.sleep(interval)